@@ -0,0 +1,49 @@
+"""Compare compiled and interpreted rendering of page-template.html.
+
+Usage: python benchmarks/templating.py [number]
+"""
+
+import sys
+import timeit
+
+from hrepr import H
+
+from starbear.core.app import templates_dir
+from starbear.core.repr import RepresenterState, StarbearHTMLGenerator
+from starbear.core.templating import Template
+
+
+def make_render(compiled):
+    page = Template(templates_dir / "page-template.html", compiled=compiled)
+    bearlib = Template(templates_dir / "bearlib-template.html", compiled=compiled)
+    hgen = StarbearHTMLGenerator(RepresenterState("/bench"))
+
+    def render():
+        node = page(
+            title="Starbear",
+            body=H.div("hello", id="hello"),
+            resources="",
+            extra="",
+            connect_line="bear.connect()",
+            bearlib=bearlib,
+            route="/bench",
+            dev=[],
+            _std=lambda name: f"/bench/file/{name}",
+            _asset=lambda name: f"/bench/file/{name}",
+        )
+        return hgen.to_string(node)
+
+    return render
+
+
+def main(number=10_000):
+    interpreted = make_render(compiled=False)
+    compiled = make_render(compiled=True)
+    assert interpreted() == compiled()
+    for name, fn in [("interpreted", interpreted), ("compiled", compiled)]:
+        t = min(timeit.repeat(fn, number=number, repeat=5))
+        print(f"{name:>12}: {t / number * 1e6:8.2f} us/render")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -5,6 +5,7 @@ from .common import UsageError, _here
 from .config import config
 from .core.app import bear, simplebear
 from .core.constructors import BrowserEvent, FormData, NamespaceDict, register_constructor
+from .core.executors import threaded
 from .core.page import Component, Page, selector_for
 from .core.reg import Reference
 from .core.repr import hrepr
@@ -32,6 +33,7 @@ __all__ = [
     "config",
     "bear",
     "simplebear",
+    "threaded",
     "BrowserEvent",
     "FormData",
     "NamespaceDict",
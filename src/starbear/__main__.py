@@ -8,6 +8,17 @@ from .common import UsageError
 from .server.config import config as server_config
 
 
+def _isolate_entry(spec):
+    prefix, _, workers = spec.partition("=")
+    try:
+        workers = int(workers or 1)
+    except ValueError:
+        workers = 0
+    if not prefix or workers < 1:
+        raise UsageError(f"--isolate expects PREFIX or PREFIX=WORKERS, not '{spec}'")
+    return prefix, workers
+
+
 @dataclass
 class Serve:
     """Start a Starbear server."""
@@ -40,6 +51,13 @@ class Serve:
     # Reloading methodology
     reload_mode: str = None
 
+    # Number of worker processes
+    # [alias: -w]
+    workers: int = None
+
+    # Route prefixes to serve from their own worker processes (PREFIX or PREFIX=WORKERS)
+    isolate: list[str] = None
+
     # SSL key file
     ssl_keyfile: str = None
 
@@ -47,6 +65,11 @@ class Serve:
     ssl_certfile: str = None
 
     def __call__(self):
+        try:
+            isolate = self.isolate and dict(map(_isolate_entry, self.isolate))
+        except UsageError as exc:
+            exit(f"ERROR: {exc}")
+
         cfg = {
             "starbear.server.root": self.path,
             "starbear.server.module": self.module,
@@ -58,6 +81,8 @@ class Serve:
             "starbear.server.reload_mode": self.reload_mode,
             "starbear.server.watch": self.watch,
             "starbear.server.open_browser": self.browser,
+            "starbear.server.workers": self.workers,
+            "starbear.server.isolate": isolate,
         }
         cfg = {k: v for k, v in cfg.items() if v is not None}
 
@@ -393,7 +393,23 @@ let commands = {
 
     async reload(sock, params) {
         window.location.reload();
-    }
+    },
+
+    async sync(sock, params) {
+        // Only carries a sequence number
+    },
+
+    async response(sock, params) {
+        sock.resolveCall(params);
+    },
+
+    async backoff(sock, params) {
+        // Handled in onmessage, because the socket may close before we get here
+    },
+
+    async "queue-ack"(sock, params) {
+        sock.resolveFeed(params);
+    },
 }
 
 
@@ -415,6 +431,12 @@ class Socket {
         this.connectionCount = 0;
         this.socket = null;
         this.tries = 0;
+        this.lastSeq = 0;
+        this.ackedSeq = 0;
+        this.callId = 0;
+        this.pendingCalls = {};
+        this.pendingFeeds = {};
+        this.backoffDelay = null;
         this.queue = [];
         this.waitPromise = null;
         this.waitReasons = [];
@@ -447,6 +469,87 @@ class Socket {
         this.socket.send(JSON.stringify(obj));
     }
 
+    isOpen() {
+        return this.socket?.readyState === WebSocket.OPEN;
+    }
+
+    call(method, args) {
+        const reqid = ++this.callId;
+        const {promise, resolve, reject} = withResolvers();
+        this.pendingCalls[reqid] = {resolve, reject};
+        try {
+            this.send({type: "method", method, reqid, args});
+        }
+        catch (error) {
+            delete this.pendingCalls[reqid];
+            throw error;
+        }
+        return promise;
+    }
+
+    feed(qid, values) {
+        const token = ++this.callId;
+        const {promise, resolve} = withResolvers();
+        this.pendingFeeds[token] = resolve;
+        try {
+            this.send({type: "queue", reqid: qid, token, values});
+        }
+        catch (error) {
+            delete this.pendingFeeds[token];
+            throw error;
+        }
+        return promise;
+    }
+
+    resolveFeed(ack) {
+        const resolve = this.pendingFeeds[ack.token];
+        if (resolve === undefined) {
+            return;
+        }
+        delete this.pendingFeeds[ack.token];
+        if (ack.error !== undefined) {
+            console.error(`[queue] ${ack.error} (id=${ack.reqid})`);
+        }
+        resolve({status: ack.error === undefined ? "ok" : "error", dropped: ack.dropped || 0});
+    }
+
+    releaseFeeds() {
+        // Acknowledgements will not come on a dead socket, do not hold the queues back
+        const pending = this.pendingFeeds;
+        this.pendingFeeds = {};
+        for (let resolve of Object.values(pending)) {
+            resolve({status: "lost", dropped: 0});
+        }
+    }
+
+    rejectCalls() {
+        // Responses will not come on a dead socket either. The call may or may not
+        // have run on the server, so it is not safe to send it again.
+        const pending = this.pendingCalls;
+        this.pendingCalls = {};
+        for (let {reject} of Object.values(pending)) {
+            reject(new Error("The connection was closed before the call returned."));
+        }
+    }
+
+    resolveCall(response) {
+        const pending = this.pendingCalls[response.reqid];
+        if (pending === undefined) {
+            return;
+        }
+        delete this.pendingCalls[response.reqid];
+        if (response.error !== undefined) {
+            this.error(response.error);
+            pending.resolve({message: response.error});
+        }
+        else if (response.html !== undefined) {
+            pending.resolve(response.html);
+        }
+        else {
+            pending.resolve(response.value);
+        }
+    }
+
     connect() {
         this.connectionCount++;
         this.socket = new WebSocket(this.url);
@@ -496,13 +599,23 @@ class Socket {
                 }
             }
             else {
+                this.ack();
                 this.requireWait("messages");
             }
         }
     }
 
+    ack() {
+        if (this.lastSeq > this.ackedSeq && this.isOpen()) {
+            this.send({type: "ack", seq: this.lastSeq});
+            this.ackedSeq = this.lastSeq;
+        }
+    }
+
     scheduleReconnect() {
-        const delay = (2 ** this.tries) * 100;
+        // Jitter the delay so that disconnected pages do not all come back at once
+        const delay = this.backoffDelay ?? (2 ** this.tries) * 100 * (0.5 + Math.random());
+        this.backoffDelay = null;
         setTimeout(
             () => {
                 this.connect();
@@ -517,7 +630,8 @@ class Socket {
 
     onopen() {
         this.tries = 0;
-        this.send({type: "start", number: this.connectionCount});
+        this.ackedSeq = this.lastSeq;
+        this.send({type: "start", number: this.connectionCount, seq: this.lastSeq});
         this.tabs.write("errors", "");
     }
 
@@ -526,15 +640,31 @@ class Socket {
         if (!Array.isArray(data)) {
             data = [data];
         }
+        for (let entry of data) {
+            if (entry.seq > this.lastSeq) {
+                this.lastSeq = entry.seq;
+            }
+            if (entry.command === "backoff") {
+                // The server is going away and tells us how long to wait before reconnecting
+                this.backoffDelay = entry.delay * 1000;
+            }
+        }
         this.queue.push(...data);
         this.wake("messages");
     }
 
     onclose(event) {
+        this.releaseFeeds();
+        this.rejectCalls();
         if (event.wasClean) {
             if (event.code === 3001) {
                 // Application is done
             }
+            else if (event.code === 1012) {
+                // Server restart
+                console.log(`[socket] Server is restarting, reconnecting in ${this.backoffDelay}ms`);
+                this.scheduleReconnect();
+            }
             else if (event.code === 3002) {
                 // Application does not exist
                 console.error(`[socket] Application does not exist.`);
@@ -635,6 +765,7 @@ export default class Starbear {
         this.tabs = this.socket.tabs;
         this.timers = {};
         this.localPromises = {};
+        this.queueStates = {};
         this.promise = reqid => new BearPromise(this, reqid);
     }
 
@@ -644,6 +775,9 @@ export default class Starbear {
 
     func(id) {
         return async (...args) => {
+            if (this.socket.isOpen()) {
+                return await this.socket.call(id, args);
+            }
             try {
                 let response = await fetch(`${this.route}/method/${id}`, {
                     method: 'POST',
@@ -691,7 +825,76 @@ export default class Starbear {
         promise.resolve(value);
     }
 
-    queue(id, feedback = false) {
+    async sendQueue(id, values) {
+        if (this.socket.isOpen()) {
+            return await this.socket.feed(id, values);
+        }
+        let response = await fetch(`${this.route}/queue`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                reqid: id,
+                values: values,
+            })
+        })
+        return response.ok ? await response.json() : {status: "error", dropped: 0};
+    }
+
+    flushQueue(id) {
+        // Only one batch per queue is in flight at a time. Values that come in
+        // meanwhile wait in the buffer until the server acknowledges it.
+        const state = this.queueStates[id];
+        if (state.inFlight || state.timer || state.buffer.length === 0) {
+            return;
+        }
+        const values = state.buffer;
+        state.buffer = [];
+        state.inFlight = true;
+        this.sendQueue(id, values)
+            .then(ack => {
+                if (ack?.dropped) {
+                    console.warn(`[queue] ${ack.dropped} value(s) dropped by full queue (id=${id})`);
+                }
+            })
+            .catch(error => this.socket.error(error.message))
+            .finally(() => {
+                state.inFlight = false;
+                this.flushQueue(id);
+            });
+    }
+
+    bufferQueue(state, value) {
+        // Apply the queue's overflow policy to the values held in the browser
+        const {maxsize = 0, overflow = "block", feedback = false} = state.options;
+        let dropped = [];
+        if (overflow === "latest") {
+            dropped = state.buffer;
+            state.buffer = [value];
+        }
+        else if (maxsize <= 0 || overflow === "block" || state.buffer.length < maxsize) {
+            state.buffer.push(value);
+        }
+        else if (overflow === "drop_oldest") {
+            dropped = [state.buffer.shift()];
+            state.buffer.push(value);
+        }
+        else {
+            dropped = [value];
+        }
+        if (feedback) {
+            for (let [_, promise] of dropped) {
+                this.resolveLocalPromise(promise.id, null);
+            }
+        }
+    }
+
+    queue(id, options = {}) {
+        if (typeof options === "boolean") {
+            options = {feedback: options};
+        }
+        const {feedback = false, batch = null} = options;
         return async value => {
             let qvalue = value
             let promise = null;
@@ -700,22 +903,31 @@ export default class Starbear {
                 this.localPromises[promise.id] = promise;
                 qvalue = [value, promise];
             }
-            let response = await fetch(`${this.route}/queue`, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({
-                    reqid: id,
-                    value: qvalue,
-                })
-            })
-            if (feedback) {
-                return await promise.promise;
+            // Serialize now, because events and elements may change by the time we send
+            qvalue = JSON.parse(JSON.stringify(qvalue));
+            if (this.queueStates[id] === undefined) {
+                this.queueStates[id] = {buffer: [], inFlight: false, timer: null, options};
+            }
+            const state = this.queueStates[id];
+            this.bufferQueue(state, qvalue);
+            if (batch) {
+                if (!state.timer) {
+                    state.timer = setTimeout(
+                        () => {
+                            state.timer = null;
+                            this.flushQueue(id);
+                        },
+                        batch * 1000,
+                    );
+                }
             }
             else {
-                return response;
+                this.flushQueue(id);
+            }
+            if (feedback) {
+                return await promise.promise;
             }
+            return null;
         }
     }
 
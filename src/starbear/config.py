@@ -1,4 +1,5 @@
 from dataclasses import dataclass, field
+from pathlib import Path
 from typing import Any
 
 import gifnoc
@@ -13,9 +14,52 @@ class StarbearDevConfig:
     inject: list[Any] = field(default_factory=list)
 
 
+@dataclass
+class StarbearFilesConfig:
+    # Serve gzip/brotli versions of files when the browser accepts them
+    compress: bool = True
+
+    # Where to store compressed files (default: ~/.cache/starbear/compressed)
+    compress_directory: Path = None
+
+    # Files smaller than this many bytes are sent as they are
+    compress_min_size: int = 1024
+
+    # Oldest compressed files are deleted when the directory exceeds this many bytes
+    compress_max_size: int = 256 * 1024 * 1024
+
+    # Files at least this many bytes large are sent with sendfile or mmap
+    large_file_size: int = 4 * 1024 * 1024
+
+    # Maximum number of large files being sent at the same time
+    max_large_transfers: int = 8
+
+
+@dataclass
+class StarbearExecutorsConfig:
+    # Maximum number of threads for synchronous callbacks (default: min(32, cpus + 4))
+    threads: int = None
+
+    # Calls that take longer than this many seconds are logged (None to disable)
+    slow_call: float = 0.5
+
+    # Number of processes for CPU-bound jobs (default: number of cores)
+    processes: int = None
+
+
+@dataclass
+class StarbearMemoryConfig:
+    # Bytes that all the bears of the process should stay under together, going
+    # by Cub.memory_estimate (the memory_budget of a bear only covers that bear)
+    budget: int = None
+
+
 @dataclass
 class StarbearConfig:
     dev: StarbearDevConfig = field(default_factory=StarbearDevConfig)
+    files: StarbearFilesConfig = field(default_factory=StarbearFilesConfig)
+    executors: StarbearExecutorsConfig = field(default_factory=StarbearExecutorsConfig)
+    memory: StarbearMemoryConfig = field(default_factory=StarbearMemoryConfig)
 
 
 config = gifnoc.define(
@@ -2,9 +2,15 @@ import asyncio as aio
 import base64
 import inspect
 import json
+import mimetypes
+import os
+import random
+import time
 import traceback
+import weakref
 from functools import cached_property, wraps
-from itertools import count, islice
+from heapq import nsmallest
+from itertools import count
 from uuid import uuid4 as uuid
 
 from hrepr import H, Tag
@@ -22,17 +28,53 @@ from starlette.websockets import WebSocket, WebSocketDisconnect
 
 from .. import config
 from ..common import here, logger
+from .compress import compressible, precompressed
 from .constructors import NamespaceDict, construct
+from .executors import run_threaded, run_timed, timed_call, wants_thread
+from .history import History
 from .page import Page
+from .reg import file_hash
 from .repr import RepresenterState, StarbearHTMLGenerator
+from .responses import (
+    FileRangeResponse,
+    RangeNotSatisfiable,
+    etag_matches,
+    large_transfer_limiter,
+    parse_range,
+    vfile_response,
+)
+from .spill import SpillStore
 from .templating import Template, template
-from .utils import Queue, format_error, keyword_decorator
+from .utils import CancelScope, Queue, format_error, keyword_decorator
 
 templates_dir = here.parent / "templates"
 assets_dir = here.parent / "assets"
 
 _count = count()
 
+# Rough cost in bytes of the things a cub holds on to, for memory_estimate
+_memory_costs = {
+    "base": 50_000,
+    "object": 500,
+    "file": 300,
+    "future": 500,
+    "queue": 1_000,
+    "queued": 500,
+    "task": 5_000,
+}
+
+
+def encode_commands(obj):
+    """Encode a command, or a list of commands, as a list of JSON strings."""
+    if not isinstance(obj, list):
+        obj = [obj]
+    return [json.dumps(cmd, separators=(",", ":"), ensure_ascii=False) for cmd in obj]
+
+
+def encode_frame(parts):
+    return "[" + ",".join(parts) + "]"
+
+
 _gc_message = (
     "It may have been garbage-collected."
     " References in the HTML trees you create are weak,"
@@ -104,6 +146,7 @@ class AbstractBear:
         self.appid = next(_count)
         self.route = None
         self.router = None
+        self.app = None
         self.representer = None
         self._json_decoder = json.JSONDecoder(object_pairs_hook=self.object_pairs_hook)
 
@@ -120,11 +163,14 @@ class AbstractBear:
     def object_pairs_hook(self, pairs):
         return NamespaceDict(pairs)
 
+    def decode(self, text):
+        return self._json_decoder.decode(text)
+
     async def json(self, request):
         body = await request.body()
         if isinstance(body, bytes):
             body = body.decode(encoding="utf8")
-        return self._json_decoder.decode(body)
+        return self.decode(body)
 
     def ensure_router(self, request):
         router = request.scope["router"]
@@ -150,9 +196,15 @@ class AbstractBear:
 
 
 class BasicBear(AbstractBear):
-    def __init__(self, template, template_params):
+    def __init__(self, template, template_params, threaded=False, max_threaded_calls=4):
         super().__init__()
         self.route = None
+        # Run synchronous callbacks in the thread pool, unless marked @threaded(False)
+        self.threaded = threaded
+        # Maximum number of callbacks of this bear running in threads at once
+        self.thread_limiter = aio.Semaphore(max_threaded_calls)
+        # Work started on behalf of the page, so that it can be cancelled all at once
+        self.scope = CancelScope()
         self._template = template
         self._template_params = {
             "title": "Starbear",
@@ -187,15 +239,36 @@ class BasicBear(AbstractBear):
             _std=lambda name: self.template_asset(name, assets_dir),
         )
 
-    def error_response(self, code, message, debug=None, exception=None):
-        msg = format_error(
+    def error_message(self, message, debug=None, exception=None):
+        return format_error(
             message=message,
             debug=debug,
             exception=exception,
             show_debug=config.dev.debug_mode,
         )
+
+    def error_response(self, code, message, debug=None, exception=None):
+        msg = self.error_message(message, debug=debug, exception=exception)
         return JSONResponse({"message": msg}, status_code=code)
 
+    async def call_method(self, method, args, kwargs={}):
+        if wants_thread(method, default=self.threaded):
+            # Timed in the thread, so that waiting for the limiter does not count
+            result = await run_threaded(
+                run_timed, method, "thread", *args, limiter=self.thread_limiter, **kwargs
+            )
+            if inspect.iscoroutine(result):
+                result = await result
+        else:
+            with timed_call(method):
+                result = method(*args, **kwargs)
+                if inspect.iscoroutine(result):
+                    result = await result
+        return result
+
+    def html(self, node):
+        return StarbearHTMLGenerator(self.representer).to_string(node)
+
     ################
     # Basic routes #
     ################
@@ -216,17 +289,20 @@ class BasicBear(AbstractBear):
         except json.JSONDecodeError:
             args = [await request.body()]
         try:
-            result = method(*args, **request.query_params)
+            call = aio.ensure_future(self.call_method(method, args, request.query_params))
+            result = await self.scope.track("calls", call)
+        except aio.CancelledError:
+            if aio.current_task().cancelling():
+                raise
+            return self.error_response(code=410, message="The page was closed.")
         except Exception as exc:
             return self.error_response(
                 code=500,
                 message="Application error.",
                 exception=exc,
             )
-        if inspect.iscoroutine(result):
-            result = await result
         if isinstance(result, Tag):
-            return HTMLResponse(self.representer(result))
+            return HTMLResponse(self.html(result))
         else:
             return JSONResponse(result)
 
@@ -248,32 +324,84 @@ class BasicBear(AbstractBear):
     @routeinfo(methods=["POST"])
     async def route_queue(self, request):
         data = await self.json(request)
-        self.representer.queue_registry.put(
+        dropped = await self.representer.queue_registry.put_many(
             qid=data["reqid"],
-            value=data["value"],
+            values=data["values"] if "values" in data else [data["value"]],
         )
-        return JSONResponse({"status": "ok"})
+        return JSONResponse({"status": "ok", "dropped": dropped})
 
     @routeinfo("/{path:path}")
     async def route_file(self, request):
         pth = self.representer.file_registry.get_file_from_url(request.path_params["path"])
-        if pth is None:
+        try:
+            stat = pth and os.stat(pth)
+            digest = stat and file_hash(pth, stat)
+        except OSError:
+            digest = None
+        if digest is None:
             raise HTTPException(status_code=404, detail="File not found or not available.")
-        return FileResponse(pth, headers={"Cache-Control": "no-cache"})
+        if request.query_params.get("v", None) == digest:
+            # The URL changes along with the contents
+            cache_control = "public, max-age=31536000, immutable"
+        else:
+            cache_control = "no-cache"
+        headers = {"Cache-Control": cache_control, "ETag": f'"{digest}"'}
+        media_type = mimetypes.guess_type(pth)[0] or "application/octet-stream"
+        large = stat.st_size >= config.files.large_file_size
+        ranged = "range" in request.headers
+        if compressible(pth) and not large:
+            headers["Vary"] = "Accept-Encoding"
+            accept = request.headers.get("accept-encoding", None)
+            if not ranged and (variant := await precompressed(pth, digest, accept)):
+                pth, encoding = variant
+                headers["Content-Encoding"] = encoding
+                headers["ETag"] = f'"{digest}-{encoding}"'
+        if etag_matches(request, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+        if not large and not ranged:
+            return FileResponse(pth, headers=headers, media_type=media_type)
+        try:
+            rng = parse_range(request, stat.st_size, etag=headers["ETag"])
+        except RangeNotSatisfiable:
+            headers["Content-Range"] = f"bytes */{stat.st_size}"
+            return Response(status_code=416, headers=headers)
+        return FileRangeResponse(
+            pth,
+            size=stat.st_size,
+            range=rng,
+            headers=headers,
+            media_type=media_type,
+            limiter=large_transfer_limiter() if large else None,
+        )
 
     @routeinfo("/{path:path}")
     async def route_vfile(self, request):
-        vf = self.representer.vfile_registry.get(request.path_params["path"])
-        return Response(content=vf.content, media_type=vf.type)
+        try:
+            vf = self.representer.vfile_registry.get(request.path_params["path"])
+        except KeyError:
+            raise HTTPException(status_code=404, detail="File not found or not available.")
+        return await vfile_response(request, vf)
 
 
 class LoneBear(BasicBear):
-    def __init__(self, fn, template=None, template_params={}, strongrefs=100):
+    def __init__(
+        self,
+        fn,
+        template=None,
+        template_params={},
+        strongrefs=100,
+        hash_files=False,
+        threaded=False,
+        max_threaded_calls=4,
+    ):
         super().__init__(
             template=template or (templates_dir / "page-template.html"),
             template_params=template_params,
+            threaded=threaded,
+            max_threaded_calls=max_threaded_calls,
         )
         self.strongrefs = strongrefs
+        self.hash_files = hash_files
         self.fn = fn
         self.__doc__ = getattr(fn, "__doc__", None)
 
@@ -285,7 +413,9 @@ class LoneBear(BasicBear):
         self.ensure_router(request)
         if self.representer is None:
             self.route = self.path_for("main").rstrip("/")
-            self.representer = RepresenterState(self.route, strongrefs=self.strongrefs)
+            self.representer = RepresenterState(
+                self.route, strongrefs=self.strongrefs, hash_files=self.hash_files
+            )
 
     def wrap_route(self, method, routeinfo):
         @wraps(method)
@@ -333,10 +463,22 @@ class Cub(BasicBear):
         template=None,
         template_params={},
         strongrefs=100,
+        batch_size=1000,
+        batch_bytes=1_000_000,
+        batch_window=0,
+        history_max_entries=None,
+        history_max_bytes=None,
+        resume_max_bytes=10_000_000,
+        future_timeout=None,
+        hash_files=False,
+        threaded=False,
+        max_threaded_calls=4,
     ):
         super().__init__(
             template=template or (templates_dir / "page-template.html"),
             template_params={"connect_line": "bear.connect()", **template_params},
+            threaded=threaded,
+            max_threaded_calls=max_threaded_calls,
         )
         self.mother = mother
         self.fn = mother.fn
@@ -344,13 +486,37 @@ class Cub(BasicBear):
         self.query_params = query_params
         self.session = session
         self.route = self.mother.path_for("main", process=self.process).rstrip("/")
-        self.representer = RepresenterState(self.route, strongrefs=strongrefs)
+        self.representer = RepresenterState(
+            self.route,
+            strongrefs=strongrefs,
+            future_timeout=future_timeout,
+            hash_files=hash_files,
+        )
         self.iq = Queue()
         self.oq = Queue()
-        self.history = []
+        self.history = History(max_entries=history_max_entries, max_bytes=history_max_bytes)
         self.reset = False
+        self.batch_size = batch_size
+        self.batch_bytes = batch_bytes
+        self.batch_window = batch_window
+        self._seq = count(1)
+        self.last_seq = 0
+        self.unacked = {}
+        self.unacked_bytes = 0
+        self.resume_max_bytes = resume_max_bytes
+        self.resume_floor = 0
         self.ws = None
-        self.page = Page(instance=self, debug=config.dev.debug_mode)
+        # Set when the client acknowledged everything that was queued for it
+        self.caught_up = aio.Event()
+        self.calls = self.scope.group("calls")
+        # Jobs submitted to the process pool by the page
+        self.jobs = self.scope.group("jobs")
+        self.last_activity = time.monotonic()
+        # Task writing the replay data to the mother's spill store, if spilled
+        self.spilled = None
+        self.page = Page(
+            instance=self, debug=config.dev.debug_mode, tasks=self.scope.group("tasks")
+        )
         self.coro = aio.create_task(self.run())
         self.log("info", "Created process")
 
@@ -361,8 +527,253 @@ class Cub(BasicBear):
             logger.error("Could not get user")
         getattr(logger, level)(msg, extra={"proc": self.process, "user": user, **extra})
 
+    def touch(self):
+        self.last_activity = time.monotonic()
+
     def destroy(self):
+        """Cancel the page's coroutine and all the work it started.
+
+        Returns the number of tasks, calls, jobs and futures that were cancelled.
+        """
         self.coro.cancel()
+        report = self.scope.cancel()
+        if futures := len(self.representer.future_registry):
+            report["futures"] = futures
+        self.representer.future_registry.reject_all("The page was closed.")
+        if report:
+            summary = ", ".join(f"{n} {name}" for name, n in report.items())
+            self.log("info", f"Cancelled outstanding work: {summary}")
+        return report
+
+    def _outgoing(self, entry):
+        """Stamp an outgoing entry with a sequence number and record it.
+
+        The sequence number is set on the last command of the entry, which the
+        client acknowledges once it has received it. Unacknowledged commands are
+        kept so that they can be sent again if the client reconnects.
+        """
+        obj, in_history = entry
+        commands = obj if isinstance(obj, list) else [obj]
+        seq = self.last_seq = next(self._seq)
+        if commands:
+            commands[-1]["seq"] = seq
+        parts = encode_commands(commands)
+        nbytes = sum(map(len, parts))
+        self.unacked[seq] = parts
+        self.unacked_bytes += nbytes
+        while self.unacked_bytes > self.resume_max_bytes:
+            self.resume_floor = next(iter(self.unacked))
+            self.unacked_bytes -= sum(map(len, self.unacked.pop(self.resume_floor)))
+        if in_history:
+            self.history.append(obj, nbytes)
+        return parts
+
+    def acknowledge(self, seq):
+        while self.unacked and (first := next(iter(self.unacked))) <= seq:
+            self.unacked_bytes -= sum(map(len, self.unacked.pop(first)))
+            self.resume_floor = first
+        if seq >= self.last_seq and self.oq.empty():
+            self.caught_up.set()
+
+    async def next_batch(self):
+        """Wait for outgoing entries and drain as many as fit in one frame.
+
+        Returns the encoded commands.
+        """
+        entry = await self.oq.get()
+        if self.batch_window and self.oq.empty():
+            await aio.sleep(self.batch_window)
+        parts = []
+        n = 0
+        total = 0
+        while True:
+            new_parts = self._outgoing(entry)
+            parts.extend(new_parts)
+            n += 1
+            total += sum(map(len, new_parts))
+            if n >= self.batch_size or total >= self.batch_bytes:
+                break
+            try:
+                entry = self.oq.get_nowait()
+            except aio.QueueEmpty:
+                break
+        return parts
+
+    def replay_frame(self, start):
+        """Return the frame that brings a newly connected client up to date.
+
+        A fresh page gets the whole history. A reconnecting page gets the commands
+        that came after the last sequence number it received, or is told to reload
+        if some of them are no longer available.
+        """
+        if self.reset:
+            self.reset = False
+            self.unacked.clear()
+            self.unacked_bytes = 0
+            self.resume_floor = self.last_seq
+            parts = [part for entry in self.history for part in encode_commands(entry)]
+            parts += encode_commands({"command": "sync", "seq": self.last_seq})
+            return parts
+        seq = start.get("seq", 0)
+        if seq < self.resume_floor:
+            return encode_commands({"command": "reload"})
+        self.acknowledge(seq)
+        return [part for parts in self.unacked.values() for part in parts]
+
+    async def socket_call(self, event):
+        """Run a method call received through the socket and send back the response."""
+        response = {"command": "response", "reqid": event["reqid"]}
+        try:
+            method = self.representer.object_registry.resolve(event["method"])
+        except KeyError:
+            response["error"] = self.error_message(
+                message="Application error: method not found.",
+                debug=_gc_message,
+            )
+        else:
+            try:
+                result = await self.call_method(method, event.get("args", []))
+                if isinstance(result, Tag):
+                    response["html"] = self.html(result)
+                else:
+                    # Serialization errors must happen here, not in the send loop
+                    json.dumps(result)
+                    response["value"] = result
+            except Exception as exc:
+                response["error"] = self.error_message(
+                    message="Application error.",
+                    exception=exc,
+                )
+        await self.oq.put((response, False))
+
+    async def socket_queue(self, event):
+        """Feed values received through the socket to a queue and acknowledge them.
+
+        The acknowledgement is only sent once the queue accepted all values, so
+        a client that waits for it before sending more is throttled by the
+        consumer.
+        """
+        ack = {"command": "queue-ack", "reqid": event["reqid"], "token": event.get("token")}
+        try:
+            ack["dropped"] = await self.representer.queue_registry.put_many(
+                qid=event["reqid"],
+                values=event["values"],
+            )
+        except KeyError:
+            logger.warning(f"Values sent to missing queue: {event['reqid']}")
+            ack["error"] = "Queue does not exist."
+        await self.oq.put((ack, False))
+
+    async def drain(self, deadline, backoff):
+        """Prepare for shutdown: finish calls, flush output, then close the socket.
+
+        Method calls made through the socket or over HTTP are waited for. The
+        page is told to wait a random delay of up to ``backoff`` seconds before
+        reconnecting, so that pages do not all come back at once, and the socket
+        is closed once the page acknowledged all output.
+        """
+
+        def remaining():
+            return max(0, deadline - time.monotonic())
+
+        if self.calls:
+            await aio.wait(list(self.calls), timeout=remaining())
+        if (ws := self.ws) is None:
+            return
+        self.caught_up.clear()
+        await self.oq.put((self.backoff_command(backoff), False))
+        try:
+            await aio.wait_for(self.caught_up.wait(), timeout=remaining())
+        except aio.TimeoutError:
+            pass
+        try:
+            await ws.close(code=1012)
+        except RuntimeError:
+            pass
+
+    def backoff_command(self, backoff):
+        return {"command": "backoff", "delay": round(random.uniform(0, backoff), 3)}
+
+    def _restore_replay(self, data):
+        self.history.load(data["history"])
+        self.unacked.update({seq: parts for seq, parts in data["unacked"]})
+        self.unacked_bytes += data["unacked_bytes"]
+
+    async def _write_spill(self, store, data):
+        try:
+            await aio.to_thread(store.put, self.process, data)
+            return True
+        except Exception as exc:
+            self.log("error", f"Could not spill replay data: {exc}")
+            self._restore_replay(data)
+            return False
+
+    async def spill(self, store):
+        """Move the history and unacknowledged commands to a spill store.
+
+        They are brought back by unspill(), which must be called before any of
+        them are needed.
+        """
+        if self.spilled is not None or not (len(self.history) or self.unacked):
+            return
+        data = {
+            "history": self.history.dump(),
+            "unacked": list(self.unacked.items()),
+            "unacked_bytes": self.unacked_bytes,
+        }
+        self.unacked = {}
+        self.unacked_bytes = 0
+        self.spilled = aio.create_task(self._write_spill(store, data))
+        await self.spilled
+
+    async def unspill(self, store):
+        """Bring back the data moved to the spill store by spill()."""
+        if (spilled := self.spilled) is None:
+            return
+        self.spilled = None
+        if await spilled:
+            try:
+                data = await aio.to_thread(store.take, self.process)
+            except Exception as exc:
+                data = None
+                self.log("error", f"Could not restore spilled replay data: {exc}")
+            if data:
+                self._restore_replay(data)
+
+    def memory_estimate(self):
+        """Approximate number of bytes held by this cub.
+
+        Histories, unacknowledged commands, unsent output and in-memory virtual
+        files are measured, everything else is counted at a flat rate per item.
+        """
+        reg = self.representer.stats()
+        ntasks = len(self.scope)
+        nqueued = reg["queued"] + self.iq.qsize() + self.oq.qsize()
+        unsent = sum(
+            len(cmd.get("content", None) or "")
+            for obj, _ in self.oq.pending()
+            for cmd in (obj if isinstance(obj, list) else [obj])
+        )
+        return (
+            _memory_costs["base"]
+            + self.history.nbytes
+            + self.unacked_bytes
+            + unsent
+            + reg["vfile_bytes"]
+            + reg["objects"] * _memory_costs["object"]
+            + reg["files"] * _memory_costs["file"]
+            + reg["futures"] * _memory_costs["future"]
+            + reg["queues"] * _memory_costs["queue"]
+            + nqueued * _memory_costs["queued"]
+            + ntasks * _memory_costs["task"]
+        )
+
+    def stats(self):
+        return {
+            "history": self.history.stats(),
+            "registries": self.representer.stats(),
+            "memory": self.memory_estimate(),
+        }
 
     async def run(self):
         reason = "done"
@@ -392,9 +803,9 @@ class Cub(BasicBear):
         else:
             return dct
 
-    async def json(self, request):
+    def decode(self, text):
         try:
-            return await super().json(request)
+            return super().decode(text)
         except KeyError as exc:
             self.page.error(
                 message=f"Error constructing: object type {exc.args[0]} unknown",
@@ -414,7 +825,9 @@ class Cub(BasicBear):
 
     @routeinfo(root=True)
     async def route_main(self, request):
-        self.mother.declare_active(self)
+        if self.ws is None:
+            # Until the page connects its socket
+            self.mother.declare_dormant(self)
         node = self.template()
         self.reset = True
         html = StarbearHTMLGenerator(self.representer).to_string(node)
@@ -429,29 +842,39 @@ class Cub(BasicBear):
 
     @routeinfo(cls=WebSocketRoute)
     async def route_socket(self, ws):
+        if self.mother.draining:
+            # Send the page away until the server is back
+            await ws.accept()
+            backoff = self.backoff_command(self.mother.drain_backoff)
+            await ws.send_text(encode_frame(encode_commands(backoff)))
+            await ws.close(code=1012)
+            return
+
         self.mother.declare_active(self)
 
         async def recv():
             while True:
                 try:
-                    data = await ws.receive_json()
-                    self.iq.put_nowait(data)
+                    text = await ws.receive_text()
                 except WebSocketDisconnect as dc:
                     if dc.code == 1000 or dc.code == 1001:
                         self.iq.put_nowait({"type": "done", "from": "recv"})
                     else:
                         self.iq.put_nowait({"type": "disconnect", "from": "recv", "error": dc})
+                    break
+                try:
+                    self.iq.put_nowait(self.decode(text))
+                except Exception:
+                    # self.decode reports the error on the page
+                    pass
 
         async def send():
             while True:
-                obj, in_history = await self.oq.get()
+                parts = await self.next_batch()
                 try:
-                    await ws.send_json(obj)
-                    if in_history:
-                        self.history.append(obj)
+                    await ws.send_text(encode_frame(parts))
                 except RuntimeError as err:
-                    # Put the unsent element back into the queue
-                    self.oq.putleft((obj, in_history))
+                    # Unsent commands remain in self.unacked, to be sent on reconnect
                     self.iq.put_nowait({"type": "error", "from": "send", "error": err})
                     break
 
@@ -464,54 +887,77 @@ class Cub(BasicBear):
         await ws.accept()
         self.ws = ws
 
-        if self.reset:
-            for entry in self.history:
-                await ws.send_text(entry)
-            self.reset = False
+        try:
+            # The client always starts with {"type": "start", "seq": <last seq received>}
+            start = await ws.receive_json()
+        except WebSocketDisconnect:
+            self.mother.declare_dormant(self)
+            return
+        await self.unspill(self.mother.spill_store)
+        if parts := self.replay_frame(start):
+            await ws.send_text(encode_frame(parts))
 
         recv_task = aio.create_task(recv())
         send_task = aio.create_task(send())
 
-        async for event in self.iq:
-            et = event["type"]
-            if et == "start":
-                # TODO: check event["number"]
-                pass
-            elif et == "done":
-                self.destroy()
-                break
-            elif et == "error":
-                self.destroy()
-                raise event["error"]
-            elif et == "disconnect":
-                # Connection may be remade later
-                self.mother.declare_dormant(self)
-                break
-            elif et == "live-disconnected":
-                for task in self.page.tasks:
-                    if task.get_name() == event["id"]:
-                        task.cancel()
-            else:
-                logger.info(f"Unrecognized message: {event!r}")
-
-        recv_task.cancel()
-        send_task.cancel()
+        try:
+            async for event in self.iq:
+                self.touch()
+                et = event["type"]
+                if et == "ack":
+                    self.acknowledge(event["seq"])
+                elif et == "queue":
+                    self.scope.track("calls", aio.create_task(self.socket_queue(event)))
+                elif et == "method":
+                    self.scope.track("calls", aio.create_task(self.socket_call(event)))
+                elif et == "done":
+                    self.mother.reap(self, reason="closed")
+                    break
+                elif et == "error":
+                    self.mother.reap(self, reason="error")
+                    raise event["error"]
+                elif et == "disconnect":
+                    # Connection may be remade later
+                    self.mother.declare_dormant(self)
+                    break
+                elif et == "live-disconnected":
+                    for task in self.page.tasks:
+                        if task.get_name() == event["id"]:
+                            task.cancel()
+                else:
+                    logger.info(f"Unrecognized message: {event!r}")
+        finally:
+            recv_task.cancel()
+            send_task.cancel()
+            if self.ws is ws:
+                self.ws = None
 
 
 def get_process_from_request(request):
     process_base = request.path_params.get("process", None)
     if process_base is None:
         process_base = base64.urlsafe_b64encode(uuid().bytes).decode("utf8").strip("=")
+        if (worker := os.environ.get("STARBEAR_WORKER", None)) is not None:
+            # Tells the front process which worker owns the session
+            process_base = f"{worker}.{process_base}"
     return process_base
 
 
 class MotherBear(AbstractBear):
+    instances = weakref.WeakSet()
+
     def __init__(
         self,
         fn,
         soft_process_cap=1_000,
         hard_process_cap=1_000_000,
         hide_processes=True,
+        dormant_ttl=3600,
+        sweep_interval=60,
+        memory_budget=None,
+        eviction="heaviest",
+        spill_directory=None,
+        spill_after=300,
         **cub_params,
     ):
         super().__init__()
@@ -524,19 +970,48 @@ class MotherBear(AbstractBear):
         self.cub_params = cub_params
         self.cubs = {}
         self.dormant_cubs = {}
+        # Seconds after which a cub without a connected page is destroyed
+        self.dormant_ttl = dormant_ttl
+        self.sweep_interval = sweep_interval
+        # Bytes that the cubs of this bear should stay under, going by Cub.memory_estimate,
+        # checked every sweep_interval (config.memory.budget covers all bears)
+        self.memory_budget = memory_budget
+        # Which dormant cubs to evict first to stay under budget: "heaviest" or "lru"
+        if eviction not in ("heaviest", "lru"):
+            raise ValueError(f"Invalid eviction order: '{eviction}'")
+        self.eviction = eviction
+        # Replay data of cubs dormant for spill_after seconds is moved to disk
+        self.spill_store = None if spill_directory is None else SpillStore(spill_directory)
+        self.spill_after = spill_after
+        self.sweeper = None
+        self.reaped = 0
+        self.draining = False
+        self.drain_backoff = 0
+        MotherBear.instances.add(self)
 
     #############
     # Utilities #
     #############
 
     def _create_new_cub(self, proc, query_params, session):
+        if self.draining:
+            raise HTTPException(
+                status_code=503,
+                detail="The server is shutting down.",
+                headers={"Retry-After": str(max(1, round(self.drain_backoff)))},
+            )
+
         reclaims = max(0, min(len(self.dormant_cubs), len(self.cubs) - self.soft_process_cap))
-        processes = list(islice(self.dormant_cubs, reclaims))
+        for cub in self.least_recently_active(reclaims):
+            self.reap(cub, reason="reclaimed")
 
-        for p in processes:
-            cub = self.dormant_cubs.pop(p)
-            cub.destroy()
-            del self.cubs[p]
+        if self.sweeper is None and (
+            self.dormant_ttl is not None
+            or self.spill_store is not None
+            or self.memory_budget is not None
+            or config.memory.budget is not None
+        ):
+            self.sweeper = aio.create_task(self.sweep())
 
         if len(self.cubs) > self.hard_process_cap:
             raise Exception("Cannot serve request: too many processes exist.")
@@ -567,6 +1042,84 @@ class MotherBear(AbstractBear):
     def declare_dormant(self, cub):
         self.dormant_cubs[cub.process] = cub
 
+    def least_recently_active(self, n):
+        return nsmallest(n, self.dormant_cubs.values(), key=lambda cub: cub.last_activity)
+
+    def reap(self, cub, reason):
+        """Destroy a cub and forget about it."""
+        if self.cubs.get(cub.process, None) is cub:
+            del self.cubs[cub.process]
+            self.dormant_cubs.pop(cub.process, None)
+            if reason != "closed":
+                self.reaped += 1
+            cub.log("info", f"Reaped process ({reason})")
+        if (spilled := cub.spilled) is not None:
+            cub.spilled = None
+            # Discarding while the write is in flight would leave its row behind
+            process = cub.process
+            spilled.add_done_callback(lambda _: self.spill_store.discard(process))
+        cub.destroy()
+
+    def memory_estimate(self):
+        return sum(cub.memory_estimate() for cub in self.cubs.values())
+
+    def enforce_budget(self):
+        """Evict dormant cubs until the memory estimate is within budget.
+
+        This measures every cub, so it is only done once per sweep.
+        """
+        if self.memory_budget is None:
+            return
+        total = self.memory_estimate()
+        if total <= self.memory_budget:
+            return
+        weights = {cub: cub.memory_estimate() for cub in self.dormant_cubs.values()}
+        if self.eviction == "heaviest":
+            order = sorted(weights, key=weights.get, reverse=True)
+        else:
+            order = self.least_recently_active(len(weights))
+        _evict(order, weights, total, self.memory_budget)
+
+    async def sweep(self):
+        """Periodically destroy or spill cubs that stayed dormant for too long."""
+        try:
+            while self.cubs:
+                await aio.sleep(self.sweep_interval)
+                now = time.monotonic()
+                for cub in self.least_recently_active(len(self.dormant_cubs)):
+                    if cub.process not in self.dormant_cubs:
+                        # Woke up while we were spilling another cub
+                        continue
+                    idle = now - cub.last_activity
+                    if self.dormant_ttl is not None and idle > self.dormant_ttl:
+                        self.reap(cub, reason="expired")
+                    elif self.spill_store is not None and idle > self.spill_after:
+                        await cub.spill(self.spill_store)
+                    else:
+                        break
+                self.enforce_budget()
+                enforce_process_budget(min_interval=self.sweep_interval)
+        finally:
+            self.sweeper = None
+
+    async def drain(self, timeout=10, backoff=5):
+        """Stop creating cubs and drain the existing ones (see Cub.drain)."""
+        self.draining = True
+        self.drain_backoff = backoff
+        deadline = time.monotonic() + timeout
+        await aio.gather(*[cub.drain(deadline, backoff) for cub in list(self.cubs.values())])
+
+    def stats(self):
+        return {
+            "live": len(self.cubs) - len(self.dormant_cubs),
+            "dormant": len(self.dormant_cubs),
+            "reaped": self.reaped,
+            "spilled": len(self.spill_store or ()),
+            "spilled_bytes": self.spill_store.nbytes if self.spill_store else 0,
+            "memory": self.memory_estimate(),
+            "memory_budget": self.memory_budget,
+        }
+
     #################
     # Mother routes #
     #################
@@ -617,6 +1170,7 @@ class MotherBear(AbstractBear):
                         status_code=404,
                     )
             else:
+                cub.touch()
                 return await method(cub, request)
 
         return forward
@@ -640,6 +1194,65 @@ class MotherBear(AbstractBear):
         ]
 
 
+def _evict(order, weights, total, budget):
+    for cub in order:
+        if total <= budget:
+            break
+        cub.mother.reap(cub, reason="over budget")
+        total -= weights[cub]
+
+
+_last_process_check = None
+
+
+def enforce_process_budget(min_interval=0):
+    """Evict the heaviest dormant cubs of all bears until config.memory.budget is met.
+
+    Only the bears running on the current event loop are considered. Every bear
+    calls this when it sweeps, so checks closer than min_interval seconds to the
+    previous one are skipped.
+    """
+    global _last_process_check
+    budget = config.memory.budget
+    now = time.monotonic()
+    if budget is None or (
+        _last_process_check is not None and now - _last_process_check < min_interval
+    ):
+        return
+    _last_process_check = now
+    loop = aio.get_running_loop()
+    cubs = [
+        cub
+        for mb in list(MotherBear.instances)
+        for cub in list(mb.cubs.values())
+        if cub.coro.get_loop() is loop
+    ]
+    weights = {cub: cub.memory_estimate() for cub in cubs}
+    total = sum(weights.values())
+    if total <= budget:
+        return
+    dormant = [cub for cub in cubs if cub.process in cub.mother.dormant_cubs]
+    _evict(sorted(dormant, key=weights.get, reverse=True), weights, total, budget)
+
+
+def _served_by(app):
+    return [mb for mb in list(MotherBear.instances) if app is None or mb.app is app]
+
+
+async def drain_all(timeout=10, backoff=5, app=None):
+    """Drain the MotherBears in this process, e.g. before shutting down.
+
+    If ``app`` is given, only the bears served through it are drained.
+    """
+    await aio.gather(*[mb.drain(timeout, backoff) for mb in _served_by(app)])
+
+
+def resume_all(app=None):
+    """Let drained MotherBears create cubs again, e.g. when serving restarts."""
+    for mb in _served_by(app):
+        mb.draining = False
+
+
 @keyword_decorator
 def bear(fn, **kwargs):
     return MotherBear(fn, **kwargs)
@@ -0,0 +1,149 @@
+import asyncio
+import gzip
+import os
+import tempfile
+from collections import OrderedDict
+from mimetypes import guess_type
+from pathlib import Path
+
+from .. import config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Encoding -> (file extension, compression function), in order of preference
+encoders = {}
+if brotli is not None:
+    encoders["br"] = (".br", lambda data: brotli.compress(data, quality=11))
+encoders["gzip"] = (".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0))
+
+_compressible_types = {
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "image/svg+xml",
+    "text/javascript",
+}
+
+# (content hash, encoding) -> compressed file, least recently used first
+_variants = OrderedDict()
+_max_variants = 1024
+
+
+def compressible(path):
+    """Whether a file is worth compressing, going by its type."""
+    typ, _ = guess_type(str(path))
+    return typ is not None and (typ.startswith("text/") or typ in _compressible_types)
+
+
+def accepted_encodings(header):
+    """Parse an Accept-Encoding header into the set of acceptable encodings."""
+    accepted = set()
+    for part in (header or "").split(","):
+        name, *params = [x.strip() for x in part.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if name and q > 0:
+            accepted.add(name.lower())
+    return accepted
+
+
+def cache_directory():
+    directory = config.files.compress_directory
+    if directory is None:
+        base = os.environ.get("XDG_CACHE_HOME", None) or Path.home() / ".cache"
+        directory = Path(base) / "starbear" / "compressed"
+    return Path(directory)
+
+
+def _prune(directory, keep):
+    """Delete the oldest compressed files until the directory fits in its budget."""
+    files = []
+    for entry in os.scandir(directory):
+        # Temporary files are still being written by another request
+        if entry.is_file() and entry.path != str(keep) and not entry.name.endswith(".tmp"):
+            stat = entry.stat()
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in files) + keep.stat().st_size
+    for _, size, file in sorted(files):
+        if total <= config.files.compress_max_size:
+            break
+        try:
+            os.unlink(file)
+        except OSError:
+            continue
+        total -= size
+
+
+def _compress(path, digest, encoding):
+    ext, compress = encoders[encoding]
+    directory = cache_directory()
+    target = directory / f"{digest}{ext}"
+    if target.exists():
+        # Mark it as recently used, so that pruning spares it
+        os.utime(target)
+    else:
+        directory.mkdir(parents=True, exist_ok=True)
+        data = Path(path).read_bytes()
+        # Write to a file of our own then rename it, so that concurrent requests
+        # never see a partial file or write into the same one
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=f"{target.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(compress(data))
+            os.replace(tmp, target)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        _prune(directory, keep=target)
+    return target
+
+
+async def precompressed(path, digest, accept_encoding):
+    """Find or create a compressed version of a file.
+
+    Compressed files are stored under the content hash of the original, so
+    they are generated once and shared by all pages and processes. The least
+    recently used ones are deleted when the directory grows larger than
+    config.files.compress_max_size.
+
+    Arguments:
+        path: The file to compress.
+        digest: The hash of the file's contents.
+        accept_encoding: The value of the request's Accept-Encoding header.
+
+    Returns:
+        A (compressed_path, encoding) tuple, or None if the file should be
+        served as is.
+    """
+    if not config.files.compress or not compressible(path):
+        return None
+    accepted = accepted_encodings(accept_encoding)
+    for encoding in encoders:
+        if encoding in accepted:
+            break
+    else:
+        return None
+    key = (digest, encoding)
+    target = _variants.get(key, None)
+    # The file may have been pruned by another process
+    if target is None or not target.exists():
+        try:
+            if os.stat(path).st_size < config.files.compress_min_size:
+                return None
+            target = await asyncio.to_thread(_compress, path, digest, encoding)
+        except OSError:
+            return None
+        _variants[key] = target
+        while len(_variants) > _max_variants:
+            _variants.popitem(last=False)
+    _variants.move_to_end(key)
+    return target, encoding
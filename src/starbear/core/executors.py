@@ -0,0 +1,201 @@
+"""Run blocking work without holding up the event loop."""
+
+import asyncio as aio
+import contextvars
+import inspect
+import multiprocessing
+import os
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from functools import partial
+
+from .. import config
+from ..common import logger
+from .utils import keyword_decorator
+
+_thread_pool = None
+_process_pool = None
+_manager = None
+_stream_readers = None
+# Event loop -> semaphore that bounds the number of concurrent streams
+_stream_slots = weakref.WeakKeyDictionary()
+
+
+def thread_pool():
+    """Return the thread pool shared by all bears, creating it if needed."""
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(
+            max_workers=config.executors.threads,
+            thread_name_prefix="starbear",
+        )
+    return _thread_pool
+
+
+def _mp_context():
+    # Forking a process that runs an event loop and threads is not safe
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _max_processes():
+    return config.executors.processes or os.cpu_count() or 1
+
+
+def process_pool():
+    """Return the process pool shared by all bears, creating it if needed."""
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(
+            max_workers=_max_processes(),
+            mp_context=_mp_context(),
+        )
+    return _process_pool
+
+
+def _process_manager():
+    # Provides the queues that streaming jobs send their values through
+    global _manager
+    if _manager is None:
+        _manager = _mp_context().Manager()
+    return _manager
+
+
+def shutdown_pools():
+    """Shut down the process pool and the manager process used for streams.
+
+    Jobs that have not started yet are cancelled. The pools are created again
+    if they are needed after this.
+    """
+    global _process_pool, _manager, _stream_readers
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+    if _manager is not None:
+        _manager.shutdown()
+        _manager = None
+    if _stream_readers is not None:
+        _stream_readers.shutdown(wait=False)
+        _stream_readers = None
+
+
+@keyword_decorator
+def threaded(fn, enabled=True):
+    """Mark a synchronous callback to run in the thread pool.
+
+    ``@threaded(False)`` keeps a callback on the event loop even if its bear
+    runs callbacks in threads by default.
+    """
+    fn.__starbear_threaded__ = enabled
+    return fn
+
+
+def wants_thread(fn, default=False):
+    """Whether a callback should run in the thread pool."""
+    if inspect.iscoroutinefunction(fn):
+        return False
+    enabled = getattr(fn, "__starbear_threaded__", None)
+    return default if enabled is None else enabled
+
+
+async def run_threaded(fn, *args, limiter=None, **kwargs):
+    """Run fn(*args, **kwargs) in the thread pool.
+
+    If a limiter (e.g. a semaphore) is given, it is held for the duration of
+    the call.
+    """
+    loop = aio.get_running_loop()
+    ctx = contextvars.copy_context()
+    async with limiter or nullcontext():
+        return await loop.run_in_executor(thread_pool(), partial(ctx.run, fn, *args, **kwargs))
+
+
+def _stream_job(fn, args, kwargs, channel, stop):
+    try:
+        for value in fn(*args, **kwargs):
+            channel.put((True, value))
+            if stop.is_set():
+                break
+    finally:
+        channel.put((False, None))
+
+
+def run_in_process(fn, *args, jobs=None, **kwargs):
+    """Submit fn(*args, **kwargs) to the process pool and return an asyncio future.
+
+    The future is kept in the jobs set until it is done. Cancelling it cancels
+    the job if it has not started yet, otherwise its result is discarded.
+    """
+    future = aio.wrap_future(process_pool().submit(fn, *args, **kwargs))
+    if jobs is not None:
+        jobs.add(future)
+        future.add_done_callback(jobs.discard)
+    return future
+
+
+def _stream_limiter():
+    global _stream_readers
+    if _stream_readers is None:
+        _stream_readers = ThreadPoolExecutor(
+            max_workers=_max_processes(),
+            thread_name_prefix="starbear-stream",
+        )
+    loop = aio.get_running_loop()
+    if (slots := _stream_slots.get(loop, None)) is None:
+        slots = _stream_slots[loop] = aio.Semaphore(_max_processes())
+    return slots
+
+
+async def stream_from_process(fn, *args, jobs=None, **kwargs):
+    """Iterate over the values yielded by generator function fn in the process pool.
+
+    Closing the iterator or cancelling the job stops the generator after the
+    next value it yields. Each stream holds a thread that waits for values, so
+    there can be no more streams than processes in the pool at a time: other
+    streams wait for one to finish before they start.
+    """
+    async with _stream_limiter():
+        loop = aio.get_running_loop()
+        manager = _process_manager()
+        channel, stop = manager.Queue(), manager.Event()
+        future = run_in_process(_stream_job, fn, args, kwargs, channel, stop, jobs=jobs)
+
+        def _cancelled(future):
+            if future.cancelled():
+                stop.set()
+                # The job may never have started, so unblock the reader ourselves
+                channel.put((False, None))
+
+        future.add_done_callback(_cancelled)
+        try:
+            while True:
+                more, value = await loop.run_in_executor(_stream_readers, channel.get)
+                if not more:
+                    break
+                yield value
+            await future
+        finally:
+            if not future.done():
+                stop.set()
+
+
+@contextmanager
+def timed_call(fn, where="event loop"):
+    """Log a warning if the block lasts longer than config.executors.slow_call seconds."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        threshold = config.executors.slow_call
+        if threshold is not None and elapsed >= threshold:
+            name = getattr(fn, "__qualname__", None) or repr(fn)
+            logger.warning(f"Slow call to {name} ({where}): {elapsed:.3f}s")
+
+
+def run_timed(fn, where, /, *args, **kwargs):
+    """Call fn(*args, **kwargs) under timed_call, e.g. from a worker thread."""
+    with timed_call(fn, where=where):
+        return fn(*args, **kwargs)
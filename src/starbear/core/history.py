@@ -0,0 +1,144 @@
+import re
+from collections import defaultdict
+from itertools import count
+
+# For each replacing method, the methods of earlier puts to the same selector
+# whose effect it erases.
+_supersedes = {
+    "innerHTML": {"innerHTML", "beforeend", "afterbegin"},
+    "outerHTML": {"innerHTML", "beforeend", "afterbegin", "outerHTML"},
+}
+
+# Selector lists and sibling combinators can reach outside of a subtree
+_unsafe = re.compile(r"[,~+]")
+_combinator = re.compile(r"\s*>\s*|\s+")
+
+
+def _commands(obj):
+    return obj if isinstance(obj, list) else [obj]
+
+
+def _root(cmd):
+    """Return the first compound selector of a put's selector.
+
+    Only puts whose selector is a chain of descendant or child combinators
+    have a root, other puts are never compacted.
+    """
+    sel = cmd.get("selector") if cmd.get("command") == "put" else None
+    if not sel or _unsafe.search(sel):
+        return None
+    return _combinator.split(sel.strip(), 1)[0]
+
+
+def _roots(obj):
+    return {root for cmd in _commands(obj) if (root := _root(cmd))}
+
+
+def _erased_by(cmd, target):
+    if _root(cmd) is None:
+        return False
+    sel, tsel = cmd["selector"].strip(), target["selector"].strip()
+    if sel == tsel:
+        return cmd.get("method") in _supersedes[target["method"]]
+    return sel.startswith(tsel) and _combinator.match(sel, len(tsel)) is not None
+
+
+class History:
+    """Commands to replay on a fresh page, compacted as they come in.
+
+    An ``innerHTML`` or ``outerHTML`` put to a selector drops earlier entries
+    that only wrote inside that same subtree, as far as their selectors tell:
+    only chains of descendant and child combinators are considered. Optional caps on the number of
+    entries and their total encoded size drop the oldest entries, which means
+    a reload may not reproduce the page exactly, so they should be generous.
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = {}
+        self.nbytes = 0
+        self.compacted = 0
+        self.compacted_bytes = 0
+        self.truncated = 0
+        self.truncated_bytes = 0
+        self._keys = count()
+        # Keys of the entries that contain puts, indexed by the root of their selector
+        self._index = defaultdict(set)
+
+    def _add(self, obj, nbytes):
+        key = next(self._keys)
+        self.entries[key] = (obj, nbytes)
+        self.nbytes += nbytes
+        for root in _roots(obj):
+            self._index[root].add(key)
+
+    def _remove(self, key):
+        obj, nbytes = entry = self.entries.pop(key)
+        self.nbytes -= nbytes
+        for root in _roots(obj):
+            self._index[root].discard(key)
+            if not self._index[root]:
+                del self._index[root]
+        return entry
+
+    def compact(self, obj):
+        targets = [
+            cmd
+            for cmd in _commands(obj)
+            if cmd.get("method") in _supersedes and _root(cmd) is not None
+        ]
+        candidates = set()
+        for target in targets:
+            candidates.update(self._index.get(_root(target), ()))
+        for key in sorted(candidates):
+            old, nbytes = self.entries[key]
+            # Entries with anything else than erased puts, e.g. evals, are kept
+            if all(any(_erased_by(cmd, t) for t in targets) for cmd in _commands(old)):
+                self._remove(key)
+                self.compacted += 1
+                self.compacted_bytes += nbytes
+
+    def append(self, obj, nbytes):
+        self.compact(obj)
+        self._add(obj, nbytes)
+        while self.entries and (
+            (self.max_entries is not None and len(self.entries) > self.max_entries)
+            or (self.max_bytes is not None and self.nbytes > self.max_bytes)
+        ):
+            _, (_, nbytes) = self._pop_oldest()
+            self.truncated += 1
+            self.truncated_bytes += nbytes
+
+    def _pop_oldest(self):
+        key = next(iter(self.entries))
+        return key, self._remove(key)
+
+    def dump(self):
+        """Remove all entries and return them as a list of (obj, nbytes) pairs."""
+        entries = list(self.entries.values())
+        self.entries = {}
+        self.nbytes = 0
+        self._index.clear()
+        return entries
+
+    def load(self, entries):
+        """Add back entries returned by dump()."""
+        for obj, nbytes in entries:
+            self._add(obj, nbytes)
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "bytes": self.nbytes,
+            "compacted": self.compacted,
+            "compacted_bytes": self.compacted_bytes,
+            "truncated": self.truncated,
+            "truncated_bytes": self.truncated_bytes,
+        }
+
+    def __iter__(self):
+        return (obj for obj, _ in self.entries.values())
+
+    def __len__(self):
+        return len(self.entries)
@@ -1,11 +1,13 @@
 import asyncio as aio
 import inspect
+from functools import wraps
 from pathlib import Path
 
 from hrepr import H, J, Tag
 from hrepr.textgen import Breakable, Sequence
 
 from ..common import logger
+from .executors import run_in_process, stream_from_process
 from .reg import Reference
 from .repr import StarbearHTMLGenerator
 from .utils import Event, FeedbackEvent, Queue, Responses, format_error
@@ -65,6 +67,22 @@ async def suppress_cancel(coro):
         logger.info(f"Cancelled: {coro}")
 
 
+def on_loop(method):
+    """Run the method in the page's event loop if it is called from another thread.
+
+    Representing elements fills the page's registries, which are not
+    thread-safe, so threaded callbacks hand over the whole call.
+    """
+
+    @wraps(method)
+    def wrapped(self, *args, **kwargs):
+        if aio._get_running_loop() is self.loop:
+            return method(self, *args, **kwargs)
+        self.loop.call_soon_threadsafe(self._deferred, method, args, kwargs)
+
+    return wrapped
+
+
 class Page:
     def __init__(
         self,
@@ -124,6 +142,7 @@ class Page:
                 hgen=self.hgen,
                 debug=self.debug,
                 loop=self.loop,
+                tasks=self.tasks,
             )
 
     def without_history(self):
@@ -137,9 +156,17 @@ class Page:
                 exception=exc,
             )
 
+    def _deferred(self, method, args, kwargs):
+        # The caller is in another thread and cannot see the error
+        try:
+            method(self, *args, **kwargs)
+        except Exception as exc:
+            self.error(
+                message="An error occurred trying to represent data.",
+                exception=exc,
+            )
+
     def _push(self, coro, label=None):
-        if aio._get_running_loop() is None:
-            aio._set_running_loop(self.loop)
         task = aio.create_task(suppress_cancel(coro), name=label)
         self.tasks.add(task)
         task.add_done_callback(self._done_cb)
@@ -252,9 +279,11 @@ class Page:
             )
         )
 
+    @on_loop
     def put_nowait(self, element, method, history=None, send_resources=True):
         self._push(self.put(element, method, history=history, send_resources=send_resources))
 
+    @on_loop
     def queue_command(self, command, /, history=None, **arguments):
         if history is None:
             history = self.track_history
@@ -264,6 +293,7 @@ class Page:
     def set_title(self, title):
         self.queue_command("put", selector="head title", content=title, method="innerHTML")
 
+    @on_loop
     def add_resources(self, *resources, type=None):
         def _build(resource, name):
             if name.endswith(".css") or type == "text/css":
@@ -291,16 +321,19 @@ class Page:
             text = self.hgen.to_string(node)
             self.queue_command("resource", content=text)
 
+    @on_loop
     def print(self, *elements, method="beforeend"):
         for element in elements:
             element = self._to_element(element)
             self.put_nowait(element, method)
 
+    @on_loop
     def error(self, message, debug=None, exception=None):
         if not isinstance(message, str):
             message = str(self.hgen.hrepr(message))
         self.queue_command("error", content=format_error(message, debug, exception, self.debug))
 
+    @on_loop
     def log(self, message):
         if not isinstance(message, str):
             message = self.representer.hrepr(message)
@@ -315,14 +348,17 @@ class Page:
             history=history,
         )
 
+    @on_loop
     def template(self, template_file, integration_method="innerHTML", **params):
         filled = self.instance.template(template_file, **params)
         self.put_nowait(filled, integration_method)
 
+    @on_loop
     def set(self, element):
         element = self._to_element(element)
         self.put_nowait(element, "innerHTML")
 
+    @on_loop
     def replace(self, element):
         element = self._to_element(element)
         self.put_nowait(element, "outerHTML")
@@ -333,12 +369,33 @@ class Page:
     def delete(self):
         self.put_nowait("", "outerHTML")
 
-    async def eval(self, code):
-        return await self.js.eval(code)
+    async def eval(self, code, timeout=None):
+        if timeout is None:
+            return await self.js.eval(code)
+        else:
+            return await aio.wait_for(self.js.eval(code), timeout)
 
     def exec(self, code, future=None):
         self.js.exec(code).__do__(future)
 
+    async def in_process(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) in the shared process pool and return the result.
+
+        The function and its arguments must be picklable, and the function
+        importable, since the processes are started fresh rather than forked.
+        The job is cancelled if the page is closed before it starts.
+        """
+        return await run_in_process(fn, *args, jobs=self.instance.jobs, **kwargs)
+
+    def stream_in_process(self, fn, *args, **kwargs):
+        """Run generator function fn in the shared process pool.
+
+        Returns an async iterator over the values it yields, which can be given
+        to page.print or live elements directly. The generator is stopped when
+        the page is closed.
+        """
+        return stream_from_process(fn, *args, jobs=self.instance.jobs, **kwargs)
+
     def toggle(self, toggle, value=None):
         return self.bearlib.toggle(self, toggle, value)
 
@@ -1,10 +1,13 @@
+import os
 import weakref
-from collections import deque
+from functools import lru_cache
 from hashlib import md5
 from itertools import count
 from pathlib import Path
 from types import MethodType
 
+from .. import config
+
 _c = count()
 
 
@@ -12,34 +15,60 @@ def _id(id=None):
     return next(_c) if id is None else id
 
 
+def _identity(obj):
+    # Bound methods are created anew on each attribute access, so they are
+    # identified by their instance and function
+    if isinstance(obj, MethodType):
+        return (id(obj.__self__), id(obj.__func__))
+    else:
+        return id(obj)
+
+
 class StrongRegistry:
     def __init__(self):
         self.map = {}
+        self.known = {}
 
     def register(self, obj, id=None):
+        key = _identity(obj)
+        if id is None and key in self.known:
+            return self.known[key]
         currid = _id(id)
         self.map[currid] = obj
+        self.known[key] = currid
         return currid
 
     def resolve(self, id):
         return self.map[id]
 
+    def __len__(self):
+        return len(self.map)
+
 
 class StrongRotatingRegistry:
     def __init__(self, keep, rotate):
         self.keep = keep
         self.rotate = rotate
+        # Ordered from least to most recently registered
         self.map = {}
-        self.ids = deque()
+        self.known = {}
 
     def register(self, obj, id=None):
-        currid = _id(id)
+        key = _identity(obj)
+        currid = self.known.get(key, None) if id is None else id
+        if currid is None:
+            currid = _id()
+        else:
+            # Move the entry to the end so that it is rotated out last
+            self.map.pop(currid, None)
         self.map[currid] = obj
-        self.ids.append(currid)
-        if len(self.ids) > self.keep >= 0:
+        self.known[key] = currid
+        if len(self.map) > self.keep >= 0:
             if self.rotate:
-                rm = self.ids.popleft()
-                del self.map[rm]
+                rm = next(iter(self.map))
+                rmkey = _identity(self.map.pop(rm))
+                if self.known.get(rmkey, None) == rm:
+                    del self.known[rmkey]
             else:
                 raise Exception("Exceeded limit for keeping strong references to objects.")
         return currid
@@ -47,18 +76,41 @@ class StrongRotatingRegistry:
     def resolve(self, id):
         return self.map[id]
 
+    def __len__(self):
+        return len(self.map)
+
 
 class WeakRegistry:
     def __init__(self):
         self.map = {}
+        self.known = {}
+
+    def _collect(self, id, key, ref):
+        # Called when the referent dies. The id may have been reused since.
+        if self.map.get(id, None) is ref:
+            del self.map[id]
+        if self.known.get(key, None) == id:
+            del self.known[key]
 
     def register(self, obj, id=None):
+        key = _identity(obj)
+        if id is None and (existing := self.known.get(key, None)) is not None:
+            ref = self.map.get(existing, None)
+            target = ref and ref()
+            if target is not None and _identity(target) == key:
+                return existing
+
         currid = _id(id)
+
+        def callback(ref):
+            self._collect(currid, key, ref)
+
         if isinstance(obj, MethodType):
-            ref = weakref.WeakMethod(obj)
+            ref = weakref.WeakMethod(obj, callback)
         else:
-            ref = weakref.ref(obj)
+            ref = weakref.ref(obj, callback)
         self.map[currid] = ref
+        self.known[key] = currid
         return currid
 
     def resolve(self, id):
@@ -68,6 +120,9 @@ class WeakRegistry:
         else:
             return value
 
+    def __len__(self):
+        return len(self.map)
+
 
 class ObjectRegistry:
     def __init__(self, strongrefs=100, rotate_strongrefs=True):
@@ -86,6 +141,9 @@ class ObjectRegistry:
         except KeyError:
             return self.sr.resolve(id)
 
+    def __len__(self):
+        return len(self.wr) + len(self.sr)
+
 
 class Reference:
     def __init__(self, datum, id=None):
@@ -93,10 +151,45 @@ class Reference:
         self.datum = datum
 
 
+@lru_cache(maxsize=4096)
+def _file_hash(filename, mtime_ns, size):
+    digest = md5()
+    with open(filename, "rb") as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_hash(filename, stat=None):
+    """Hash a file's contents, reusing the result until it is modified.
+
+    Large files are not read: their modification time and size stand in for
+    the hash.
+    """
+    stat = stat or os.stat(filename)
+    if stat.st_size >= config.files.large_file_size:
+        return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+    return _file_hash(str(filename), stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=1024)
+def _find_fs_anchor(directory):
+    # Cached across registries, so each directory is only walked once per process
+    anchor = directory
+    while not (anchor / "starbear-anchor").exists():
+        anchor = anchor.parent
+        if anchor == Path("/"):
+            return directory
+    return anchor
+
+
 class FileRegistry:
-    def __init__(self):
+    def __init__(self, hash_files=False):
+        # Append ?v=<content hash> to URLs, so that they can be cached forever
+        self.hash_files = hash_files
         self.file_to_url = {}
         self.url_to_file = {}
+        self.registered = {}
 
     def find_anchor(self, filename):
         filename = filename.absolute()
@@ -106,12 +199,7 @@ class FileRegistry:
             if anchor in self.file_to_url:
                 return (anchor, self.file_to_url[anchor])
         else:
-            anchor = filename.parent
-            while not (anchor / "starbear-anchor").exists():
-                anchor = anchor.parent
-                if anchor == Path("/"):
-                    anchor = filename.parent
-                    break
+            anchor = _find_fs_anchor(filename.parent)
             url = md5(str(anchor).encode("utf8")).hexdigest()
             self.file_to_url[anchor] = url
             self.url_to_file[url] = anchor
@@ -119,16 +207,27 @@ class FileRegistry:
 
     def register(self, filename):
         filename = filename.absolute()
-        anchor, base_url = self.find_anchor(filename)
-        url = str(base_url / filename.relative_to(anchor))
+        if (url := self.registered.get(filename, None)) is None:
+            anchor, base_url = self.find_anchor(filename)
+            url = f"{base_url}/{filename.relative_to(anchor).as_posix()}"
+            self.registered[filename] = url
+        if self.hash_files:
+            try:
+                return f"{url}?v={file_hash(filename)}"
+            except OSError:
+                pass
         return url
 
     def get_file_from_url(self, url):
-        url = orig = Path(url)
-        while url != url.parent and str(url) not in self.url_to_file:
-            url = url.parent
-        anchor = self.url_to_file.get(str(url), None)
-        return anchor and str(anchor / orig.relative_to(url))
+        base_url, _, rest = url.partition("/")
+        anchor = self.url_to_file.get(base_url, None)
+        parts = rest.split("/")
+        if anchor is None or any(part in ("", "..") for part in parts):
+            return None
+        return str(anchor.joinpath(*parts))
+
+    def __len__(self):
+        return len(self.url_to_file)
 
 
 class VFileRegistry:
@@ -142,28 +241,52 @@ class VFileRegistry:
     def get(self, pth):
         return self.vfiles[pth]
 
+    def nbytes(self):
+        return sum(len(vf.content) for vf in self.vfiles.values() if vf.in_memory)
+
+    def __len__(self):
+        return len(self.vfiles)
+
 
 class FutureRegistry:
-    def __init__(self):
+    def __init__(self, timeout=None):
         self.current_id = count()
         self.futures = {}
+        self.timeout = timeout
 
-    def register(self, future):
+    def register(self, future, timeout=None):
         fid = next(self.current_id)
         self.futures[fid] = future
+        # Forget the future if it is resolved or cancelled by other means
+        future.add_done_callback(lambda _: self.futures.pop(fid, None))
+        timeout = self.timeout if timeout is None else timeout
+        if timeout is not None:
+            handle = future.get_loop().call_later(timeout, self.expire, fid, timeout)
+            future.add_done_callback(lambda _: handle.cancel())
         return fid
 
+    def _settle(self, fid):
+        future = self.futures.pop(fid, None)
+        return None if future is None or future.done() else future
+
     def resolve(self, fid, value):
-        if fid not in self.futures:
-            return
-        self.futures[fid].set_result(value)
-        del self.futures[fid]
+        if future := self._settle(fid):
+            future.set_result(value)
 
     def reject(self, fid, error):
-        if fid not in self.futures:
-            return
-        self.futures[fid].set_exception(Exception(error))
-        del self.futures[fid]
+        if future := self._settle(fid):
+            future.set_exception(Exception(error))
+
+    def expire(self, fid, timeout):
+        if future := self._settle(fid):
+            future.set_exception(TimeoutError(f"No response from the page after {timeout}s"))
+
+    def reject_all(self, error):
+        for fid in list(self.futures):
+            self.reject(fid, error)
+
+    def __len__(self):
+        return len(self.futures)
 
 
 class QueueRegistry:
@@ -178,3 +301,23 @@ class QueueRegistry:
 
     def put(self, qid, value):
         self.queues[qid].put_nowait(value)
+
+    async def put_many(self, qid, values):
+        """Put values in a queue according to its overflow policy.
+
+        Queues without a policy block until there is room. Returns the number
+        of values that were dropped.
+        """
+        queue = self.queues[qid]
+        if getattr(queue, "overflow", "block") == "block":
+            for value in values:
+                await queue.put(value)
+            return 0
+        else:
+            return sum(queue.offer(value) for value in values)
+
+    def depth(self):
+        return sum(queue.qsize() for queue in self.queues.values())
+
+    def __len__(self):
+        return len(self.queues)
@@ -1,3 +1,4 @@
+import json
 from asyncio import Future, Queue
 from dataclasses import dataclass, field, fields as dataclass_fields, is_dataclass
 from pathlib import Path
@@ -47,7 +48,7 @@ hrepr = Interface(StarbearHrepr, **config_defaults)
 
 
 class RepresenterState:
-    def __init__(self, route, strongrefs=False):
+    def __init__(self, route, strongrefs=False, future_timeout=None, hash_files=False):
         self.route = route
         self.store = {}
         if strongrefs is True:
@@ -58,11 +59,22 @@ class RepresenterState:
             self.object_registry = ObjectRegistry(strongrefs=-strongrefs, rotate_strongrefs=True)
         else:
             self.object_registry = ObjectRegistry(strongrefs=strongrefs, rotate_strongrefs=False)
-        self.file_registry = FileRegistry()
+        self.file_registry = FileRegistry(hash_files=hash_files)
         self.vfile_registry = VFileRegistry()
-        self.future_registry = FutureRegistry()
+        self.future_registry = FutureRegistry(timeout=future_timeout)
         self.queue_registry = QueueRegistry()
 
+    def stats(self):
+        return {
+            "objects": len(self.object_registry),
+            "files": len(self.file_registry),
+            "vfiles": len(self.vfile_registry),
+            "futures": len(self.future_registry),
+            "queues": len(self.queue_registry),
+            "queued": self.queue_registry.depth(),
+            "vfile_bytes": self.vfile_registry.nbytes(),
+        }
+
 
 class StarbearHTMLGenerator(HTMLGenerator):
     def __init__(self, representer_state):
@@ -93,6 +105,21 @@ class StarbearBlockGenerator(BlockGenerator):
     def register_queue(self, x, **kwargs):
         return self.global_generator.state.queue_registry.register(x, **kwargs)
 
+    def queue_embed(self, queue, feedback=False):
+        qid = self.register_queue(queue)
+        options = {
+            "feedback": feedback,
+            "batch": getattr(queue, "batch", None),
+            "maxsize": queue.maxsize,
+            "overflow": getattr(queue, "overflow", "block"),
+        }
+        defaults = {"feedback": False, "batch": None, "maxsize": 0, "overflow": "block"}
+        options = {k: v for k, v in options.items() if v != defaults[k]}
+        if options:
+            return f"$$BEAR.queue({qid}, {json.dumps(options)})"
+        else:
+            return f"$$BEAR.queue({qid})"
+
     @extend_super
     def node_embed(self, elem: HasNodeName["live-element"]):  # noqa: F811, F821
         attrs = dict(elem.attributes)
@@ -127,12 +154,10 @@ class StarbearBlockGenerator(BlockGenerator):
         return f"$$BEAR.promise({fid})"
 
     def js_embed(self, queue: Queue):  # noqa: F811
-        qid = self.register_queue(queue)
-        return f"$$BEAR.queue({qid})"
+        return self.queue_embed(queue)
 
     def js_embed(self, queue: FeedbackQueue):  # noqa: F811
-        qid = self.register_queue(queue)
-        return f"$$BEAR.queue({qid}, true)"
+        return self.queue_embed(queue, feedback=True)
 
     @extend_super
     def attr_embed(self, fn: Union[MethodType, FunctionType]):  # noqa: F811
@@ -144,8 +169,7 @@ class StarbearBlockGenerator(BlockGenerator):
         return f"obj#{obj_id}"
 
     def attr_embed(self, queue: Queue):  # noqa: F811
-        qid = self.register_queue(queue)
-        return f"$$BEAR.event.call(this, $$BEAR.queue({qid}))"
+        return f"$$BEAR.event.call(this, {self.queue_embed(queue)})"
 
     def attr_embed(self, pth: Path):  # noqa: F811
         new_pth = self.register_file(pth)
@@ -0,0 +1,168 @@
+import asyncio
+import mmap
+import weakref
+from contextlib import nullcontext
+
+from starlette.responses import Response, StreamingResponse
+
+from .. import config
+
+# Event loop -> semaphore shared by the transfers of large files on that loop
+_large_transfers = weakref.WeakKeyDictionary()
+
+
+def large_transfer_limiter():
+    """Semaphore shared by all transfers of large files on the running event loop."""
+    loop = asyncio.get_running_loop()
+    if (limiter := _large_transfers.get(loop, None)) is None:
+        limiter = _large_transfers[loop] = asyncio.Semaphore(config.files.max_large_transfers)
+    return limiter
+
+
+def etag_matches(request, etag):
+    """Check whether an If-None-Match header lists the given ETag."""
+    header = request.headers.get("if-none-match", None)
+    if header is None:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag in tags
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(request, size, etag=None):
+    """Parse the Range header of a request for a resource of the given size.
+
+    Only single ranges are supported. Returns None if the whole resource should
+    be sent, otherwise a (start, end) tuple with an exclusive end. Raises
+    RangeNotSatisfiable if the range lies outside of the resource.
+    """
+    header = request.headers.get("range", None)
+    if header is None or size is None:
+        return None
+    if_range = request.headers.get("if-range", None)
+    if if_range is not None and if_range != etag:
+        # The client's copy is outdated, so it needs everything
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            if last and int(last) < start:
+                # Syntactically invalid, so the header is ignored (RFC 9110)
+                return None
+            end = min(int(last) + 1, size) if last else size
+        elif last:
+            start = max(size - int(last), 0)
+            end = size
+        else:
+            return None
+    except ValueError:
+        return None
+    if start >= end:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+class FileRangeResponse(Response):
+    """Send a file, or a range of it, without reading it into Python buffers.
+
+    The file is sent with the server's ``http.response.zerocopysend`` extension
+    if it has it, which lets the kernel copy it to the socket directly.
+    Otherwise, it is memory-mapped and sent in chunks. Transfers can be made to
+    wait on a limiter, such as an asyncio.Semaphore.
+    """
+
+    chunk_size = 1024 * 1024
+
+    def __init__(self, path, size, range=None, headers=None, media_type=None, limiter=None):
+        self.path = path
+        self.start, self.end = range or (0, size)
+        self.status_code = 200 if range is None else 206
+        self.media_type = media_type
+        self.background = None
+        self.limiter = limiter
+        headers = {
+            **(headers or {}),
+            "Accept-Ranges": "bytes",
+            "Content-Length": str(self.end - self.start),
+        }
+        if range is not None:
+            headers["Content-Range"] = f"bytes {self.start}-{self.end - 1}/{size}"
+        self.init_headers(headers)
+
+    async def __call__(self, scope, receive, send):
+        count = self.end - self.start
+        # Only open the file once we may send it, queued transfers hold no descriptor
+        async with self.limiter or nullcontext():
+            with open(self.path, "rb") as f:
+                await send(
+                    {
+                        "type": "http.response.start",
+                        "status": self.status_code,
+                        "headers": self.raw_headers,
+                    }
+                )
+                if scope["method"].upper() == "HEAD" or count == 0:
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+                elif "http.response.zerocopysend" in scope.get("extensions", {}):
+                    await send(
+                        {
+                            "type": "http.response.zerocopysend",
+                            "file": f.fileno(),
+                            "offset": self.start,
+                            "count": count,
+                            "more_body": False,
+                        }
+                    )
+                else:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        for pos in range(self.start, self.end, self.chunk_size):
+                            end = min(pos + self.chunk_size, self.end)
+                            # Page faults may hit the disk, keep them off the event loop
+                            body = await asyncio.to_thread(mm.__getitem__, slice(pos, end))
+                            await send(
+                                {
+                                    "type": "http.response.body",
+                                    "body": body,
+                                    "more_body": end < self.end,
+                                }
+                            )
+
+
+async def vfile_response(request, vf):
+    """Serve a VirtualFile, with support for ETags and Range requests."""
+    headers = {}
+    if vf.digest is not None:
+        headers["ETag"] = f'"{vf.digest}"'
+        if etag_matches(request, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+
+    if not vf.replayable:
+        if vf.consumed:
+            return Response("This file was already downloaded.", status_code=410)
+        return StreamingResponse(vf.chunks(), media_type=vf.type, headers=headers)
+
+    size = await vf.size()
+    headers["Accept-Ranges"] = "bytes"
+    try:
+        rng = parse_range(request, size, etag=headers.get("ETag", None))
+    except RangeNotSatisfiable:
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(status_code=416, headers=headers)
+
+    if rng is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(vf.chunks(), media_type=vf.type, headers=headers)
+    else:
+        start, end = rng
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+        headers["Content-Length"] = str(end - start)
+        return StreamingResponse(
+            vf.chunks(start, end), status_code=206, media_type=vf.type, headers=headers
+        )
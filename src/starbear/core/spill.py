@@ -0,0 +1,65 @@
+import json
+import os
+import sqlite3
+import threading
+import weakref
+import zlib
+from pathlib import Path
+from uuid import uuid4
+
+
+def _cleanup(db, path):
+    db.close()
+    path.unlink(missing_ok=True)
+
+
+class SpillStore:
+    """Store on disk for the replay data of dormant cubs.
+
+    Values are compressed JSON in a sqlite database that belongs to this
+    process and is deleted when the store is garbage collected or the process
+    exits. Methods block and are thread-safe, so they can be called through
+    asyncio.to_thread.
+    """
+
+    def __init__(self, directory):
+        directory = Path(directory).expanduser()
+        directory.mkdir(parents=True, exist_ok=True)
+        self.path = directory / f"spill-{os.getpid()}-{uuid4().hex[:8]}.sqlite"
+        self.db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        # This is a cache: durability does not matter
+        self.db.execute("PRAGMA synchronous = OFF")
+        self.db.execute("CREATE TABLE spill (key TEXT PRIMARY KEY, data BLOB)")
+        self.lock = threading.Lock()
+        self.nbytes = 0
+        self.sizes = {}
+        self._finalize = weakref.finalize(self, _cleanup, self.db, self.path)
+
+    def put(self, key, value):
+        data = zlib.compress(json.dumps(value).encode("utf8"), 1)
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO spill VALUES (?, ?)", (key, data))
+            self.nbytes += len(data) - self.sizes.get(key, 0)
+            self.sizes[key] = len(data)
+
+    def take(self, key):
+        """Remove a value from the store and return it, or None if it is not there."""
+        with self.lock:
+            row = self.db.execute("SELECT data FROM spill WHERE key = ?", (key,)).fetchone()
+            self._delete(key)
+        return row and json.loads(zlib.decompress(row[0]))
+
+    def discard(self, key):
+        with self.lock:
+            self._delete(key)
+
+    def _delete(self, key):
+        if key in self.sizes:
+            self.db.execute("DELETE FROM spill WHERE key = ?", (key,))
+            self.nbytes -= self.sizes.pop(key)
+
+    def close(self):
+        self._finalize()
+
+    def __len__(self):
+        return len(self.sizes)
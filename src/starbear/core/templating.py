@@ -1,8 +1,9 @@
 import re
+from collections import OrderedDict
 from pathlib import Path
 from typing import Union
 
-from hrepr import H, Tag
+from hrepr import H, HTMLGenerator, Tag
 from lxml import etree
 from ovld import ovld
 
@@ -80,12 +81,12 @@ def _html_to_h(etree):
     )
 
 
-_cached_templates = {}
-
-
 class Template:
-    def __init__(self, tpl, location=None):
+    def __init__(self, tpl, location=None, compiled=True):
         self.location = location
+        # Tag templates may hold functions, paths, etc. in their attributes, which
+        # only the page's representer can serialize, so they are not compiled
+        compiled = compiled and not isinstance(tpl, Tag)
         if isinstance(tpl, Tag):
             self.template = tpl
         elif isinstance(tpl, Path):
@@ -94,6 +95,7 @@ class Template:
         elif isinstance(tpl, str):
             tpl = _parse_template(tpl)
         self.template = tpl
+        self.plan = _compile(tpl) if compiled else None
 
     def __call__(self, **values):
         values.setdefault("_variable", lambda name: values[name])
@@ -106,15 +108,69 @@ class Template:
                 )
 
             values.setdefault("_embed", embed)
-        return _template(self.template, values)
+        if self.plan is None:
+            return _template(self.template, values)
+        elif isinstance(self.plan, _Static):
+            return self.plan.value
+        else:
+            return self.plan(values)
+
+
+class TemplateCache:
+    """LRU cache of parsed templates.
+
+    Templates read from a file are re-read when the file's mtime or size changes.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, tpl, nocache=False):
+        stamp = None
+        if isinstance(tpl, Path):
+            try:
+                st = tpl.stat()
+                stamp = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                pass
+        entry = self.entries.get(tpl, None)
+        if entry is not None and not nocache and entry[0] == stamp:
+            self.hits += 1
+            self.entries.move_to_end(tpl)
+            return entry[1]
+        self.misses += 1
+        result = Template(tpl)
+        self.entries[tpl] = (stamp, result)
+        self.entries.move_to_end(tpl)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return result
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        return {
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+template_cache = TemplateCache()
 
 
 def template(tpl, nocache=False, /, **values):
     if isinstance(tpl, Tag):
         return Template(tpl)(**values)
-    if tpl not in _cached_templates or nocache:
-        _cached_templates[tpl] = Template(tpl)
-    return _cached_templates[tpl](**values)
+    return template_cache.get(tpl, nocache)(**values)
 
 
 @ovld
@@ -149,3 +205,94 @@ def _template(tpl: Template, values: dict):
 @ovld
 def _template(node: object, values: dict):
     return node
+
+
+###############
+# Compilation #
+###############
+
+
+# Nodes that the block generators treat specially, which we must not pre-serialize
+_special_nodes = {"construct", "live-element", "raw"}
+
+_static_generator = HTMLGenerator()
+
+
+class _Static:
+    """Part of a template that does not depend on the values."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+
+def _run(parts, values):
+    return [part.value if isinstance(part, _Static) else part(values) for part in parts]
+
+
+def _plain(node):
+    # Whether a generic HTMLGenerator renders the node exactly as the page would
+    if isinstance(node, Tag):
+        return (
+            node.name not in _special_nodes
+            and all(isinstance(v, (str, bool)) for v in node.attributes.values())
+            and all(map(_plain, node.children))
+        )
+    return isinstance(node, str)
+
+
+def _serialize(run):
+    if not any(isinstance(x, Tag) for x in run) or not all(map(_plain, run)):
+        return run
+    return [H.raw(_static_generator.to_string(H.inline(*run)))]
+
+
+def _compile(node):
+    """Compile a parsed template into a render plan.
+
+    Returns either a _Static wrapping the part of the template that does not
+    depend on the values, or a function of the values that renders it. Runs of
+    static children are serialized to HTML once, so that only the placeholders
+    need to be evaluated on each call.
+    """
+    if isinstance(node, Placeholder):
+        key = f"_{node.type}"
+        name = node.name
+        return lambda values: _template(values[key](name), values)
+
+    elif isinstance(node, PlaceholderSequence):
+        parts = [_compile(x) for x in node]
+        return lambda values: "".join(map(str, _run(parts, values)))
+
+    elif isinstance(node, Tag):
+        attributes = {k: _compile(v) for k, v in node.attributes.items()}
+        children = [_compile(child) for child in node.children]
+        static = all(isinstance(x, _Static) for x in (*attributes.values(), *children))
+        if static and node.name not in _special_nodes:
+            return _Static(node)
+
+        plan = []
+        run = []
+        for child in children:
+            if isinstance(child, _Static):
+                run.append(child.value)
+            else:
+                plan.extend(_Static(x) for x in _serialize(run))
+                plan.append(child)
+                run = []
+        plan.extend(_Static(x) for x in _serialize(run))
+
+        name = node.name
+        attrs = list(attributes.items())
+
+        def render(values):
+            return Tag(name).fill(
+                children=_run(plan, values),
+                attributes={k: v.value if isinstance(v, _Static) else v(values) for k, v in attrs},
+            )
+
+        return render
+
+    else:
+        return _Static(node)
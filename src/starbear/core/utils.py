@@ -1,10 +1,12 @@
 import asyncio
 import functools
+import io
 import traceback
 from dataclasses import dataclass, field
 from enum import Enum
 from hashlib import md5
 from mimetypes import guess_type
+from uuid import uuid4
 
 from hrepr.resource import JSExpression
 
@@ -33,7 +35,86 @@ def keyword_decorator(deco):
     return new_deco
 
 
+class CancelScope:
+    """Named groups of tasks and futures that are cancelled together."""
+
+    def __init__(self):
+        self.groups = {}
+
+    def group(self, name):
+        """Return the set of pending futures for name, which may be shared with others."""
+        return self.groups.setdefault(name, set())
+
+    def track(self, name, future):
+        group = self.group(name)
+        group.add(future)
+        future.add_done_callback(group.discard)
+        return future
+
+    def cancel(self):
+        """Cancel everything still pending and return how many were cancelled per group."""
+        report = {}
+        for name, group in self.groups.items():
+            if cancelled := sum(future.cancel() for future in list(group) if not future.done()):
+                report[name] = cancelled
+        return report
+
+    def __len__(self):
+        return sum(len(group) for group in self.groups.values())
+
+
 class Queue(asyncio.Queue):
+    OVERFLOW_POLICIES = ("block", "drop_oldest", "drop_newest", "latest")
+
+    def __init__(self, maxsize=0, *, batch=None, overflow="block"):
+        super().__init__(maxsize)
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Invalid overflow policy for Queue: '{overflow}'")
+        # Seconds during which the browser accumulates values before sending them
+        self.batch = batch
+        # What to do with values from the browser when the queue is full:
+        # * block: wait for room (the browser holds further values meanwhile)
+        # * drop_oldest: discard the oldest pending value
+        # * drop_newest: discard the incoming value
+        # * latest: discard all pending values, whether the queue is full or not
+        self.overflow = overflow
+        # Number of values discarded because of the overflow policy
+        self.dropped = 0
+
+    def _drop(self, value):
+        self.dropped += 1
+
+    def _discard(self, n):
+        for _ in range(n):
+            self._drop(self._queue.popleft())
+            self.task_done()
+
+    def offer(self, value):
+        """Put a value without waiting, applying the overflow policy.
+
+        Returns the number of values that were dropped. With the ``block``
+        policy, a full queue raises ``QueueFull``.
+        """
+        if self.overflow == "latest":
+            dropped = self.qsize()
+            self._discard(dropped)
+        elif not self.full():
+            dropped = 0
+        elif self.overflow == "drop_oldest":
+            dropped = 1
+            self._discard(dropped)
+        elif self.overflow == "drop_newest":
+            self._drop(value)
+            return 1
+        else:
+            raise asyncio.QueueFull()
+        self.put_nowait(value)
+        return dropped
+
+    def pending(self):
+        """Return the values waiting in the queue, oldest first."""
+        return list(self._queue)
+
     def putleft(self, entry):
         self._queue.appendleft(entry)
         self._unfinished_tasks += 1
@@ -92,20 +173,121 @@ def format_error(message, debug=None, exception=None, show_debug=False):
 
 
 class FeedbackQueue(Queue):
-    pass
+    def _drop(self, value):
+        # Settle the browser's promise so that it does not wait forever
+        super()._drop(value)
+        _, resolve = value
+        asyncio.ensure_future(resolve(None))
 
 
 class VirtualFile:
+    """File served from memory or from a stream.
+
+    The content may be a string, bytes, a memoryview, a file-like object opened
+    in binary mode, or an async iterator of bytes. Files in memory are named
+    after the hash of their contents, computed when they are first served.
+    Streams get a random name. Seekable file-like objects can be served any
+    number of times, with Range support, and their hash is computed the first
+    time they are read in full. Non-seekable streams and async iterators can
+    only be served once.
+    """
+
+    chunk_size = 64 * 1024
+
     def __init__(self, content, type=None, name=None):
         if type is None:
             if name is not None:
                 type, _ = guess_type(url=name)
 
+        if isinstance(content, str):
+            content = content.encode("utf8")
+        elif isinstance(content, memoryview):
+            content = content.cast("B")
+
         self.type = type
         self.content = content
-        self.name = md5(content.encode("utf8")).hexdigest()
-        if name is not None:
-            self.name += f"/{name}"
+        self.basename = name
+        self.in_memory = isinstance(content, (bytes, bytearray, memoryview))
+        self.seekable = not self.in_memory and getattr(content, "seekable", lambda: False)()
+        self.consumed = False
+        self._digest = None
+        self._lock = asyncio.Lock()
+
+    @functools.cached_property
+    def name(self):
+        name = self.digest or uuid4().hex
+        if self.basename is not None:
+            name += f"/{self.basename}"
+        return name
+
+    @property
+    def digest(self):
+        """Hash of the contents, or None if they were never read in full."""
+        if self._digest is None and self.in_memory:
+            self._digest = md5(self.content).hexdigest()
+        return self._digest
+
+    @property
+    def replayable(self):
+        return self.in_memory or self.seekable
+
+    async def size(self):
+        """Size of the contents in bytes, or None if it is unknown."""
+        if self.in_memory:
+            return len(self.content)
+        elif self.seekable:
+            async with self._lock:
+                return await asyncio.to_thread(self.content.seek, 0, io.SEEK_END)
+        else:
+            return None
+
+    def _read_at(self, pos, n):
+        self.content.seek(pos)
+        return self.content.read(n)
+
+    def chunks(self, start=0, end=None):
+        """Iterate over the contents from start (inclusive) to end (exclusive).
+
+        A stream that cannot be replayed is marked as consumed as soon as this
+        is called, so that two concurrent requests cannot both get it.
+        """
+        if not self.replayable:
+            if self.consumed:
+                raise Exception("This stream was already consumed.")
+            self.consumed = True
+            return self._stream()
+        return self._chunks(start, end)
+
+    async def _chunks(self, start, end):
+        if self.in_memory:
+            view = memoryview(self.content)[start:end]
+            for i in range(0, len(view), self.chunk_size):
+                yield bytes(view[i : i + self.chunk_size])
+
+        else:
+            # Hash along the way when reading everything, so that it is only read once
+            digest = md5() if start == 0 and end is None and self._digest is None else None
+            pos = start
+            while end is None or pos < end:
+                n = self.chunk_size if end is None else min(self.chunk_size, end - pos)
+                async with self._lock:
+                    chunk = await asyncio.to_thread(self._read_at, pos, n)
+                if not chunk:
+                    break
+                pos += len(chunk)
+                if digest is not None:
+                    digest.update(chunk)
+                yield chunk
+            if digest is not None:
+                self._digest = digest.hexdigest()
+
+    async def _stream(self):
+        if hasattr(self.content, "__aiter__"):
+            async for chunk in self.content:
+                yield chunk.encode("utf8") if isinstance(chunk, str) else chunk
+        else:
+            while chunk := await asyncio.to_thread(self.content.read, self.chunk_size):
+                yield chunk
 
 
 def rewrap(old_func, new_func):
@@ -91,6 +91,18 @@ class StarbearServerBaseConfig:
     # Reloading methodology
     reload_mode: str = "jurigged"
 
+    # Seconds given to pages to finish pending calls and flush output on shutdown
+    drain_timeout: float = 10
+
+    # Pages reconnect after a random delay of up to this many seconds on shutdown
+    drain_backoff: float = 5
+
+    # Number of worker processes (sessions stick to the worker that created them)
+    workers: int = 1
+
+    # Route prefixes served by their own worker processes, with the number of workers for each
+    isolate: dict[str, int] = field(default_factory=dict)
+
     # SSL configuration
     ssl: StarbearSSLConfig = field(default_factory=StarbearSSLConfig)
 
@@ -13,7 +13,7 @@ from starlette.routing import Mount, Route
 
 import starbear
 
-from ..core.app import AbstractBear
+from ..core.app import AbstractBear, LoneBear
 from .index import Index
 
 
@@ -103,6 +103,27 @@ def compile_routes(path, obj: Route):  # noqa: F811
     return [obj]
 
 
+@ovld
+def lonebear_prefixes(path, routes: dict):
+    routes = {pth.rstrip("/"): r for pth, r in routes.items()}
+    if "/" not in routes and "/index" in routes:
+        # Like compile_routes, which also serves the index at the root
+        routes["/"] = routes["/index"]
+    return _flatten(
+        [lonebear_prefixes(path.rstrip("/") + path2, route) for path2, route in routes.items()]
+    )
+
+
+@ovld
+def lonebear_prefixes(path, lb: LoneBear):  # noqa: F811
+    return [path or "/"]
+
+
+@ovld
+def lonebear_prefixes(path, obj: object):  # noqa: F811
+    return []
+
+
 exclusions = {
     Path(starbear.__file__).parent,
     Path(starlette.__file__).parent,
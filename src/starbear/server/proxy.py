@@ -0,0 +1,267 @@
+import asyncio
+import os
+import re
+import signal
+from contextlib import suppress
+from itertools import count
+
+import httpx
+import uvicorn
+from websockets.asyncio.client import unix_connect
+from websockets.exceptions import ConnectionClosed, InvalidHandshake
+
+from ..common import logger
+
+# Headers that only concern one connection and must not be forwarded
+_hop_by_hop = {
+    b"connection",
+    b"keep-alive",
+    b"proxy-authenticate",
+    b"proxy-authorization",
+    b"te",
+    b"trailers",
+    b"transfer-encoding",
+    b"upgrade",
+}
+
+# Headers set by the websocket client library itself
+_ws_own_headers = {
+    b"host",
+    b"sec-websocket-extensions",
+    b"sec-websocket-key",
+    b"sec-websocket-protocol",
+    b"sec-websocket-version",
+    *_hop_by_hop,
+}
+
+_process_rx = re.compile(r"/!(\d+)\.")
+
+
+class WorkerPool:
+    """Worker processes listening on unix sockets.
+
+    ``groups`` maps route prefixes to the indexes of the workers that serve
+    them. By default, all workers serve all routes.
+    """
+
+    def __init__(self, paths, processes=(), groups=None):
+        self.paths = [str(p) for p in paths]
+        self.processes = list(processes)
+        # (prefix, worker) for the LoneBears, see pin()
+        self.pins = []
+        groups = groups or {"/": range(len(self.paths))}
+        # Longest prefixes first, so that the most specific group wins
+        self.groups = sorted(
+            ((prefix.rstrip("/"), list(workers), count()) for prefix, workers in groups.items()),
+            key=lambda group: len(group[0]),
+            reverse=True,
+        )
+
+    def choose(self, path):
+        """Pick the worker for a request path.
+
+        Paths that name a process (``/!{worker}.{id}/...``) go to the worker
+        that created it and pinned LoneBears go to their worker. Anything else
+        goes in turn to the workers of the group with the longest matching
+        prefix.
+        """
+        if (m := _process_rx.search(path)) and (worker := int(m.group(1))) < len(self.paths):
+            return worker
+        for prefix, worker in self.pins:
+            if path in (prefix, f"{prefix}/") or path.startswith(f"{prefix}/!/"):
+                return worker
+        for prefix, workers, turn in self.groups:
+            if path == prefix or path.startswith(f"{prefix}/"):
+                return workers[next(turn) % len(workers)]
+        raise LookupError(f"No worker serves {path}")
+
+    def pin(self, prefix):
+        """Send a LoneBear's page and its ``/!/`` routes to a single worker.
+
+        A LoneBear keeps its functions and files in the worker that served the
+        page, and its URLs do not name that worker.
+        """
+        prefix = prefix.rstrip("/")
+        worker = self.choose(f"{prefix}/")
+        self.pins.append((prefix, worker))
+        return worker
+
+    def terminate(self, timeout=None):
+        for proc in self.processes:
+            if proc.is_alive():
+                os.kill(proc.pid, signal.SIGTERM)
+        for proc in self.processes:
+            proc.join(timeout)
+            if proc.is_alive():
+                proc.kill()
+
+
+class WorkerProxy:
+    """ASGI application that forwards HTTP and websocket traffic to a WorkerPool."""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.clients = [
+            httpx.AsyncClient(
+                transport=httpx.AsyncHTTPTransport(uds=path),
+                base_url="http://starbear-worker",
+                timeout=None,
+            )
+            for path in pool.paths
+        ]
+
+    def target(self, scope):
+        path = scope.get("raw_path", None) or scope["path"].encode("utf8")
+        if scope["query_string"]:
+            path += b"?" + scope["query_string"]
+        return path.decode("latin-1")
+
+    def forwarded_headers(self, scope, exclude):
+        headers = [(k, v) for k, v in scope["headers"] if k not in exclude]
+        if client := scope.get("client", None):
+            headers.append((b"x-forwarded-for", client[0].encode("latin-1")))
+        headers.append((b"x-forwarded-proto", scope["scheme"].encode("latin-1")))
+        return headers
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            await self.http(scope, receive, send)
+        elif scope["type"] == "websocket":
+            await self.websocket(scope, receive, send)
+        elif scope["type"] == "lifespan":
+            await self.lifespan(scope, receive, send)
+
+    async def lifespan(self, scope, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                for client in self.clients:
+                    await client.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def http(self, scope, receive, send):
+        # Request bodies are small (method calls, queue values), read them in full
+        body = []
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                return
+            body.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+
+        client = self.clients[self.pool.choose(scope["path"])]
+        request = client.build_request(
+            scope["method"],
+            self.target(scope),
+            headers=self.forwarded_headers(scope, exclude=_hop_by_hop),
+            content=b"".join(body),
+        )
+        try:
+            response = await client.send(request, stream=True)
+        except httpx.TransportError as exc:
+            logger.error(f"Could not reach worker: {exc}")
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 502,
+                    "headers": [(b"content-type", b"text/plain")],
+                }
+            )
+            await send({"type": "http.response.body", "body": b"Bad gateway"})
+            return
+        try:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": response.status_code,
+                    "headers": [
+                        (k, v) for k, v in response.headers.raw if k.lower() not in _hop_by_hop
+                    ],
+                }
+            )
+            async for chunk in response.aiter_raw():
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            await response.aclose()
+
+    async def websocket(self, scope, receive, send):
+        await receive()  # websocket.connect
+        worker = self.pool.choose(scope["path"])
+        try:
+            upstream = await unix_connect(
+                self.pool.paths[worker],
+                f"ws://starbear-worker{self.target(scope)}",
+                additional_headers=self.forwarded_headers(scope, exclude=_ws_own_headers),
+                subprotocols=scope.get("subprotocols", None) or None,
+                max_size=None,
+                compression=None,
+            )
+        except (OSError, InvalidHandshake) as exc:
+            logger.error(f"Could not open websocket to worker {worker}: {exc}")
+            await send({"type": "websocket.close", "code": 1011})
+            return
+
+        await send({"type": "websocket.accept", "subprotocol": upstream.subprotocol})
+
+        async def client_to_worker():
+            while True:
+                message = await receive()
+                if message["type"] == "websocket.receive":
+                    text = message.get("text", None)
+                    try:
+                        await upstream.send(message["bytes"] if text is None else text)
+                    except ConnectionClosed:
+                        return
+                else:
+                    await upstream.close(code=message.get("code", 1000))
+                    return
+
+        async def worker_to_client():
+            try:
+                async for data in upstream:
+                    key = "text" if isinstance(data, str) else "bytes"
+                    await send({"type": "websocket.send", key: data})
+            except ConnectionClosed:
+                pass
+            # Pass on the close code, which tells the page what to do next
+            with suppress(OSError, RuntimeError):
+                await send(
+                    {
+                        "type": "websocket.close",
+                        "code": upstream.close_code or 1000,
+                        "reason": upstream.close_reason or "",
+                    }
+                )
+
+        tasks = [
+            asyncio.create_task(client_to_worker()),
+            asyncio.create_task(worker_to_client()),
+        ]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await upstream.close()
+
+
+class ProxyServer(uvicorn.Server):
+    """Front server that stops the workers before itself when shutting down.
+
+    The workers drain their sessions while the proxy still relays their
+    messages, so that pages receive their reconnection delays.
+    """
+
+    def __init__(self, config, pool, drain_timeout=10):
+        super().__init__(config)
+        self.pool = pool
+        self.drain_timeout = drain_timeout
+
+    async def shutdown(self, sockets=None):
+        await asyncio.to_thread(self.pool.terminate, self.drain_timeout + 5)
+        await super().shutdown(sockets=sockets)
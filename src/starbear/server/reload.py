@@ -12,6 +12,8 @@ from sse_starlette.sse import EventSourceResponse
 from starlette.routing import Route
 from watchdog.observers import Observer
 
+from ..core.app import drain_all
+
 logger = logging.getLogger("starbear")
 
 
@@ -104,6 +106,11 @@ class BaseReloader(InertReloader):
 
     async def reboot(self, request):
         logger.info("Rebooting the server...")
+        await drain_all(
+            timeout=self.server.config.drain_timeout,
+            backoff=self.server.config.drain_backoff,
+            app=self.server.app,
+        )
         os.environ["STARBEAR_RELOAD_OVERRIDE"] = json.dumps(
             tuple(self.server.config.socket.getsockname())
         )
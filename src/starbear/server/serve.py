@@ -1,3 +1,8 @@
+import multiprocessing
+import os
+import shutil
+import signal
+import tempfile
 import threading
 import time
 import webbrowser
@@ -13,14 +18,45 @@ from hrepr import H
 from starlette.applications import Starlette
 from starlette.middleware.httpsredirect import HTTPSRedirectMiddleware
 
-from ..common import logger
+from ..common import UsageError, logger
 from ..config import config as base_config
+from ..core.app import drain_all, resume_all
+from ..core.executors import shutdown_pools
 from .config import StarbearServerConfig
-from .find import compile_routes
+from .find import compile_routes, lonebear_prefixes
 from .plugins.session import Session
+from .proxy import ProxyServer, WorkerPool, WorkerProxy
 
 
-class ThreadableServer(uvicorn.Server):
+class DrainingServer(uvicorn.Server):
+    drain_timeout = 10
+    drain_backoff = 5
+
+    async def startup(self, sockets=None):
+        # The same bears may be served again after a previous server drained them
+        resume_all(app=self.config.app)
+        await super().startup(sockets=sockets)
+
+    async def shutdown(self, sockets=None):
+        # Let the bears finish their business and spread out reconnections.
+        # Only this server's bears are drained: others may share the process.
+        await drain_all(
+            timeout=self.drain_timeout,
+            backoff=self.drain_backoff,
+            app=self.config.app,
+        )
+        await super().shutdown(sockets=sockets)
+
+
+class WorkerServer(DrainingServer):
+    def handle_exit(self, sig, frame):
+        # Ctrl+C reaches the whole process group, but workers should wait for
+        # the front process to tell them to drain
+        if sig != signal.SIGINT:
+            super().handle_exit(sig, frame)
+
+
+class ThreadableServer(DrainingServer):
     def install_signal_handlers(self):
         pass
 
@@ -45,6 +81,7 @@ class ThreadableServer(uvicorn.Server):
 class StarbearServer:
     def __init__(self, config: StarbearServerConfig):
         self.config = config
+        self.worker = None
 
     @cached_property
     def reloader(self):
@@ -98,12 +135,8 @@ class StarbearServer:
 
         @app.on_event("startup")
         async def _():
-            protocol = "https" if self.config.ssl.enabled else "http"
-            host, port = self.config.socket.getsockname()
-            url = f"{protocol}://{host}:{port}"
-            logger.info(f"Serving at: {url}")
-            if self.config.open_browser:
-                webbrowser.open(url)
+            if self.worker is None:
+                self.announce()
 
         def _ensure(filename, enabled):
             if not enabled or not filename:
@@ -158,10 +191,32 @@ class StarbearServer:
 
         self.inject_routes()
 
+    def announce(self):
+        protocol = "https" if self.config.ssl.enabled else "http"
+        host, port = self.config.socket.getsockname()
+        url = f"{protocol}://{host}:{port}"
+        logger.info(f"Serving at: {url}")
+        if self.config.open_browser:
+            webbrowser.open(url)
+
     @contextmanager
     def _server(self, *, thread=False, **uvicorn_options):
-        self._setup()
-        server_class = ThreadableServer if thread else uvicorn.Server
+        if not hasattr(self, "app"):
+            self._setup()
+        if thread:
+            server_class = ThreadableServer
+        elif self.worker is not None:
+            server_class = WorkerServer
+        else:
+            server_class = DrainingServer
+        options = {
+            "fd": self.config.socket.fileno(),
+            "ssl_keyfile": self.ssl_keyfile,
+            "ssl_certfile": self.ssl_certfile,
+            **uvicorn_options,
+        }
+        if options.get("uds", None):
+            del options["fd"]
         with gifnoc.overlay(
             {
                 "starbear": {
@@ -172,19 +227,91 @@ class StarbearServer:
                 }
             }
         ):
+            uconfig = uvicorn.Config(app=self.app, log_level="info", **options)
+            server = server_class(uconfig)
+            server.drain_timeout = self.config.drain_timeout
+            server.drain_backoff = self.config.drain_backoff
+            yield server
+
+    def run(self, **uvicorn_options):
+        if self.config.workers > 1 or self.config.isolate:
+            return self.run_workers(**uvicorn_options)
+        with self._server(thread=False, **uvicorn_options) as server:
+            try:
+                server.run()
+            finally:
+                # The pools are shared by the whole process, which ends here
+                shutdown_pools()
+
+    def _run_worker(self, index, path, uvicorn_options):
+        os.environ["STARBEAR_WORKER"] = str(index)
+        self.worker = index
+        # The front process owns the public socket and terminates SSL
+        self.config.socket.close()
+        with self._server(
+            uds=path, ssl_keyfile=None, ssl_certfile=None, **uvicorn_options
+        ) as server:
+            try:
+                server.run()
+            finally:
+                shutdown_pools()
+
+    def run_workers(self, **uvicorn_options):
+        """Serve from several worker processes behind a front proxy.
+
+        Each process lives in the worker that created it, so the proxy routes
+        requests and sockets by the worker index embedded in the process id.
+        Route prefixes listed in ``isolate`` get their own workers, so that a
+        busy app does not hold up the others. LoneBear URLs carry no worker
+        index, so each LoneBear is pinned to one worker.
+        """
+        if self.config.dev:
+            raise UsageError("Multiple workers cannot be used in dev/reload mode.")
+
+        # Set up and bind before forking, so that the workers share the
+        # session secret and can close the public socket
+        self._setup()
+        sock = self.config.socket
+
+        ctx = multiprocessing.get_context("fork")
+        groups = {}
+        nworkers = 0
+        for prefix, n in {"/": self.config.workers, **self.config.isolate}.items():
+            if n < 1:
+                raise UsageError(f"At least one worker is needed to serve {prefix}")
+            groups[prefix] = range(nworkers, nworkers + n)
+            nworkers += n
+
+        tmpdir = tempfile.mkdtemp(prefix="starbear-workers-")
+        paths = [os.path.join(tmpdir, f"worker{i}.sock") for i in range(nworkers)]
+        pool = WorkerPool(paths, groups=groups)
+        for prefix in lonebear_prefixes("/", self.app.map):
+            pool.pin(prefix)
+        try:
+            for i, path in enumerate(paths):
+                proc = ctx.Process(target=self._run_worker, args=(i, path, uvicorn_options))
+                proc.start()
+                pool.processes.append(proc)
+
+            while not all(os.path.exists(path) for path in paths):
+                if not all(proc.is_alive() for proc in pool.processes):
+                    raise RuntimeError("A worker process failed to start.")
+                time.sleep(0.01)
+
             uconfig = uvicorn.Config(
-                app=self.app,
-                fd=self.config.socket.fileno(),
+                app=WorkerProxy(pool),
+                fd=sock.fileno(),
                 log_level="info",
                 ssl_keyfile=self.ssl_keyfile,
                 ssl_certfile=self.ssl_certfile,
-                **uvicorn_options,
             )
-            yield server_class(uconfig)
-
-    def run(self, **uvicorn_options):
-        with self._server(thread=False, **uvicorn_options) as server:
+            server = ProxyServer(uconfig, pool, drain_timeout=self.config.drain_timeout)
+            logger.info(f"Started {len(paths)} workers")
+            self.announce()
             server.run()
+        finally:
+            pool.terminate(self.config.drain_timeout + 5)
+            shutil.rmtree(tmpdir, ignore_errors=True)
 
     @contextmanager
     def run_in_thread(self, **uvicorn_options):
@@ -0,0 +1,31 @@
+import asyncio
+
+from hrepr import H
+
+from starbear import Resource as R, bear
+
+
+@bear
+async def __app__(page):
+    async def slow():
+        await asyncio.sleep(10)
+        return "done"
+
+    page.print(H.script(f"window.slow = {R(slow)}"))
+    await page.wait()
+
+
+def test_call_rejected_on_close(app):
+    result = app.evaluate(
+        """async () => {
+            const call = slow();
+            $$BEAR.socket.socket.close();
+            try {
+                return await call;
+            }
+            catch (error) {
+                return error.message;
+            }
+        }"""
+    )
+    assert result == "The connection was closed before the call returned."
@@ -0,0 +1,46 @@
+import asyncio
+import gzip
+
+import gifnoc
+
+from starbear.core.compress import accepted_encodings, precompressed
+from starbear.core.reg import file_hash
+
+
+def test_accepted_encodings():
+    assert accepted_encodings("gzip, deflate;q=0.5, br;q=0") == {"gzip", "deflate"}
+    assert accepted_encodings(None) == set()
+
+
+def test_precompressed(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    big = tmp_path / "big.js"
+    big.write_text("console.log('hello');\n" * 1000)
+    small = tmp_path / "small.js"
+    small.write_text("1")
+
+    target, encoding = asyncio.run(precompressed(big, file_hash(big), "gzip"))
+    assert encoding == "gzip"
+    assert target.parent == tmp_path / "cache" / "starbear" / "compressed"
+    assert gzip.decompress(target.read_bytes()) == big.read_bytes()
+    assert [p.name for p in target.parent.iterdir()] == [target.name]
+
+    assert asyncio.run(precompressed(big, file_hash(big), "identity")) is None
+    assert asyncio.run(precompressed(small, file_hash(small), "gzip")) is None
+    assert asyncio.run(precompressed(tmp_path / "x.png", "abc", "gzip")) is None
+
+
+def test_precompressed_prune(tmp_path):
+    files = []
+    for i in range(3):
+        files.append(tmp_path / f"{i}.js")
+        files[-1].write_text(f"console.log({i});\n" * 1000)
+    cache = tmp_path / "cache"
+    overlay = {"starbear": {"files": {"compress_directory": str(cache), "compress_max_size": 1}}}
+    with gifnoc.overlay(overlay):
+        # Only the file that was just compressed fits in the budget
+        targets = [asyncio.run(precompressed(f, file_hash(f), "gzip"))[0] for f in files]
+        assert [target.exists() for target in targets] == [False, False, True]
+        # Pruned files are compressed again
+        target, _ = asyncio.run(precompressed(files[0], file_hash(files[0]), "gzip"))
+        assert target.exists() and not targets[2].exists()
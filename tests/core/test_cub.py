@@ -0,0 +1,471 @@
+import asyncio
+import logging
+import re
+import threading
+import time
+from functools import partial
+
+import gifnoc
+import pytest
+from hrepr import H
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from starbear import bear
+from starbear.core.app import LoneBear, drain_all, resume_all
+from starbear.core.spill import SpillStore
+from starbear.core.utils import Queue
+
+
+def open_page(client, path="/"):
+    """Load the page and return the route of its process."""
+    response = client.get(path)
+    return re.search(r'new Constructor\("([^"]+)"\)', response.text).group(1)
+
+
+def entries(frame):
+    # The last command of each entry carries its sequence number
+    return [cmd for cmd in frame if "seq" in cmd]
+
+
+def start(ws, seq=0):
+    ws.send_json({"type": "start", "number": 1, "seq": seq})
+    return ws.receive_json()
+
+
+def test_batch_framing():
+    @bear(batch_size=4)
+    async def app(page):
+        for i in range(10):
+            page.print(H.div(i))
+        await page.wait()
+
+    with TestClient(app) as client:
+        route = open_page(client)
+        with client.websocket_connect(f"{route}/socket") as ws:
+            assert start(ws) == [{"command": "sync", "seq": 0}]
+            frames = [ws.receive_json() for _ in range(3)]
+
+    assert [len(entries(frame)) for frame in frames] == [4, 4, 2]
+    assert [cmd["content"] for frame in frames for cmd in entries(frame)] == [
+        f"<div>{i}</div>" for i in range(10)
+    ]
+    assert [frame[-1]["seq"] for frame in frames] == [4, 8, 10]
+
+
+def test_batch_bytes():
+    @bear(batch_bytes=1)
+    async def app(page):
+        for i in range(3):
+            page.print(H.div(i))
+        await page.wait()
+
+    with TestClient(app) as client:
+        route = open_page(client)
+        with client.websocket_connect(f"{route}/socket") as ws:
+            start(ws)
+            frames = [ws.receive_json() for _ in range(3)]
+
+    assert [len(entries(frame)) for frame in frames] == [1, 1, 1]
+
+
+def commands(ws, until):
+    """Receive commands until one of them satisfies the until predicate."""
+    received = []
+    while not any(until(cmd) for cmd in received):
+        received += ws.receive_json()
+    return received
+
+
+def command_kind(cmd):
+    return (cmd.get("command"), cmd.get("reqid"))
+
+
+def is_kind(kind, cmd):
+    return command_kind(cmd) == kind
+
+
+def queue_app(overflow):
+    @bear
+    async def app(page):
+        q = Queue(2, overflow=overflow)
+        go = Queue()
+        page.print(H.div(H.button(onclick=q), H.button(onclick=go)))
+        await go.get()
+        page.print(H.div(str([q.get_nowait() for _ in range(q.qsize())])))
+        await page.wait()
+
+    return app
+
+
+@pytest.mark.parametrize(
+    "overflow,dropped,kept",
+    [
+        ("drop_oldest", 2, [3, 4]),
+        ("drop_newest", 2, [1, 2]),
+        ("latest", 3, [4]),
+    ],
+)
+def test_queue_overflow(overflow, dropped, kept):
+    with TestClient(queue_app(overflow)) as client:
+        route = open_page(client)
+        with client.websocket_connect(f"{route}/socket") as ws:
+            start(ws)
+            page = commands(ws, lambda cmd: cmd.get("command") == "put")
+            qid, go = map(int, re.findall(r"\$\$BEAR\.queue\((\d+)", page[-1]["content"]))
+
+            ws.send_json({"type": "queue", "reqid": qid, "token": 1, "values": [1, 2, 3, 4]})
+            [ack] = commands(ws, lambda cmd: cmd.get("command") == "queue-ack")
+            assert (ack["reqid"], ack["token"], ack["dropped"]) == (qid, 1, dropped)
+
+            ws.send_json({"type": "queue", "reqid": go, "token": 2, "values": [None]})
+            result = commands(ws, lambda cmd: cmd.get("command") == "put")
+            assert result[-1]["content"] == f"<div>{kept}</div>"
+
+
+def test_queue_overflow_block():
+    with TestClient(queue_app("block")) as client:
+        route = open_page(client)
+        with client.websocket_connect(f"{route}/socket") as ws:
+            start(ws)
+            page = commands(ws, lambda cmd: cmd.get("command") == "put")
+            qid, go = map(int, re.findall(r"\$\$BEAR\.queue\((\d+)", page[-1]["content"]))
+
+            ws.send_json({"type": "queue", "reqid": qid, "token": 1, "values": [1, 2, 3, 4]})
+            ws.send_json({"type": "queue", "reqid": go, "token": 2, "values": [None]})
+            received = []
+            for kind in [("put", None), ("queue-ack", qid)]:
+                if kind not in map(command_kind, received):
+                    received += commands(ws, partial(is_kind, kind))
+
+    # The last two values waited for room instead of displacing the first two
+    kinds = list(map(command_kind, received))
+    put = kinds.index(("put", None))
+    ack = kinds.index(("queue-ack", qid))
+    assert received[put]["content"] == "<div>[1, 2]</div>"
+    assert received[ack]["dropped"] == 0
+
+
+def seqs(frame):
+    return [cmd["seq"] for cmd in entries(frame)]
+
+
+def test_ack_and_resume():
+    @bear
+    async def app(page):
+        def ping():
+            return "pong"
+
+        for i in range(3):
+            page.print(H.div(i))
+        page.print(H.button(onclick=ping))
+        await page.wait()
+
+    with TestClient(app) as client:
+        route = open_page(client)
+        with client.websocket_connect(f"{route}/socket") as ws:
+            start(ws)
+            received = commands(ws, lambda cmd: cmd.get("seq") == 4)
+            [method] = re.findall(r"\$\$BEAR\.func\((\d+)", received[-1]["content"])
+            ws.send_json({"type": "ack", "seq": 2})
+            # The response comes after the acknowledgement is processed
+            ws.send_json({"type": "method", "reqid": 1, "method": int(method), "args": []})
+            [response] = commands(ws, lambda cmd: cmd.get("command") == "response")
+            assert (response["value"], response["seq"]) == ("pong", 5)
+            ws.close(code=4000)
+
+        # The acknowledged frames are gone
+        with client.websocket_connect(f"{route}/socket") as ws:
+            assert start(ws, seq=1) == [{"command": "reload"}]
+            ws.close(code=4000)
+
+        # The others are replayed
+        with client.websocket_connect(f"{route}/socket") as ws:
+            assert seqs(start(ws, seq=3)) == [4, 5]
+
+
+def test_resume_below_floor():
+    @bear(resume_max_bytes=400)
+    async def app(page):
+        for i in range(5):
+            page.print(H.div(str(i) * 100))
+        await page.wait()
+
+    with TestClient(app) as client:
+        route = open_page(client)
+        with client.websocket_connect(f"{route}/socket") as ws:
+            start(ws)
+            commands(ws, lambda cmd: cmd.get("seq") == 5)
+            ws.close(code=4000)
+
+        # Each frame takes about 200 bytes, so only the last two are kept
+        with client.websocket_connect(f"{route}/socket") as ws:
+            assert start(ws, seq=2) == [{"command": "reload"}]
+            ws.close(code=4000)
+
+        with client.websocket_connect(f"{route}/socket") as ws:
+            assert seqs(start(ws, seq=3)) == [4, 5]
+
+
+def idle_app():
+    @bear(dormant_ttl=0.05, sweep_interval=0.02)
+    async def app(page):
+        page.print(H.div("hello"))
+        await page.wait()
+
+    return app
+
+
+def test_expire_unconnected():
+    app = idle_app()
+    with TestClient(app) as client:
+        route = open_page(client)
+        assert len(app.cubs) == 1
+        time.sleep(0.2)
+        assert len(app.cubs) == 0
+        assert app.reaped == 1
+
+        with client.websocket_connect(f"{route}/socket") as ws:
+            with pytest.raises(WebSocketDisconnect) as exc:
+                ws.receive_json()
+            assert exc.value.code == 3002
+
+
+def test_expire_disconnected():
+    app = idle_app()
+    with TestClient(app) as client:
+        route = open_page(client)
+        with client.websocket_connect(f"{route}/socket") as ws:
+            start(ws)
+            time.sleep(0.2)
+            # Connected pages do not expire
+            assert len(app.cubs) == 1
+            ws.close(code=4000)
+
+        time.sleep(0.2)
+        assert len(app.cubs) == 0
+
+        with client.websocket_connect(f"{route}/socket") as ws:
+            with pytest.raises(WebSocketDisconnect) as exc:
+                start(ws, seq=1)
+            assert exc.value.code == 3002
+
+
+def budget_app(eviction, sizes):
+    sizes = iter(sizes)
+
+    @bear(
+        memory_budget=250_000,
+        eviction=eviction,
+        dormant_ttl=None,
+        sweep_interval=0.02,
+    )
+    async def app(page):
+        page.print(H.div("x" * next(sizes)))
+        await page.wait()
+
+    return app
+
+
+@pytest.mark.parametrize(
+    "eviction,sizes,kept",
+    [
+        # Each page costs at least 50KB, the largest one is evicted
+        ("heaviest", [0, 200_000, 0, 0], [0, 2, 3]),
+        # The least recently active page is evicted
+        ("lru", [0, 50_000, 0, 0], [1, 2, 3]),
+    ],
+)
+def test_memory_budget(eviction, sizes, kept):
+    app = budget_app(eviction, sizes)
+    with TestClient(app) as client:
+        routes = [open_page(client) for _ in sizes]
+        time.sleep(0.1)
+        assert sorted(routes.index(cub.route) for cub in app.cubs.values()) == kept
+        assert app.stats()["memory"] <= 250_000
+
+
+def test_process_memory_budget():
+    apps = [budget_app("heaviest", sizes) for sizes in ([0, 0], [100_000, 0])]
+    for app in apps:
+        app.memory_budget = None
+    routes = [Mount(f"/{i}", routes=app.routes()) for i, app in enumerate(apps)]
+    with gifnoc.overlay({"starbear": {"memory": {"budget": 300_000}}}):
+        with TestClient(Starlette(routes=routes)) as client:
+            for i in range(2):
+                open_page(client, f"/{i}/")
+                open_page(client, f"/{i}/")
+            time.sleep(0.1)
+            # The heaviest page of either bear is evicted for the whole to fit
+            assert [len(app.cubs) for app in apps] == [2, 1]
+            assert sum(app.memory_estimate() for app in apps) <= 300_000
+
+
+def test_memory_budget_spares_connected():
+    app = budget_app("heaviest", [300_000])
+    with TestClient(app) as client:
+        route = open_page(client)
+        with client.websocket_connect(f"{route}/socket") as ws:
+            start(ws)
+            time.sleep(0.1)
+            assert len(app.cubs) == 1
+
+
+def test_reap_while_spilling(tmp_path, monkeypatch):
+    writing = threading.Event()
+    put = SpillStore.put
+
+    def slow_put(self, key, value):
+        writing.set()
+        time.sleep(0.2)
+        put(self, key, value)
+
+    monkeypatch.setattr(SpillStore, "put", slow_put)
+
+    @bear(spill_directory=tmp_path, spill_after=0, dormant_ttl=None, sweep_interval=0.02)
+    async def app(page):
+        page.print(H.div("hello"))
+        await page.wait()
+
+    with TestClient(app) as client:
+        route = open_page(client)
+        with client.websocket_connect(f"{route}/socket") as ws:
+            start(ws)
+            commands(ws, lambda cmd: cmd.get("seq") == 1)
+            ws.close(code=4000)
+
+        assert writing.wait(1)
+        [cub] = app.cubs.values()
+        client.portal.call(app.reap, cub, "expired")
+        time.sleep(0.4)
+        assert len(app.spill_store) == 0
+
+
+def test_drain():
+    @bear
+    async def app(page):
+        async def slow():
+            await asyncio.sleep(0.2)
+            return "done"
+
+        page.print(H.button(onclick=slow))
+        await page.wait()
+
+    # As it is served, so that the 503 goes through Starlette's exception handling
+    with TestClient(Starlette(routes=app.routes())) as client:
+        route = open_page(client)
+        with client.websocket_connect(f"{route}/socket") as ws:
+            start(ws)
+            button = commands(ws, lambda cmd: cmd.get("seq") == 1)[-1]
+            [method] = re.findall(r"\$\$BEAR\.func\((\d+)", button["content"])
+            ws.send_json({"type": "method", "reqid": 1, "method": int(method), "args": []})
+            time.sleep(0.05)
+            drained = client.portal.start_task_soon(app.drain, 2, 0)
+
+            # The call is finished before the page is told to back off
+            received = commands(ws, lambda cmd: cmd.get("command") == "backoff")
+            assert [cmd["command"] for cmd in received] == ["response", "backoff"]
+            assert received[0]["value"] == "done"
+            assert not drained.done()
+
+            # The socket is closed once the page acknowledged everything
+            ws.send_json({"type": "ack", "seq": received[-1]["seq"]})
+            with pytest.raises(WebSocketDisconnect) as exc:
+                ws.receive_json()
+            assert exc.value.code == 1012
+            drained.result(timeout=1)
+            # Like a browser, echo the code of the closing handshake
+            ws.close(code=1012)
+
+        # Reconnecting pages are sent away as well
+        with client.websocket_connect(f"{route}/socket") as ws:
+            assert [cmd["command"] for cmd in ws.receive_json()] == ["backoff"]
+            with pytest.raises(WebSocketDisconnect) as exc:
+                ws.receive_json()
+            assert exc.value.code == 1012
+
+        assert client.get("/").status_code == 503
+
+
+def test_drain_app():
+    @bear
+    async def app1(page):
+        await page.wait()
+
+    @bear
+    async def app2(page):
+        await page.wait()
+
+    server1 = Starlette(routes=app1.routes())
+    server2 = Starlette(routes=app2.routes())
+    with TestClient(server1) as client1, TestClient(server2) as client2:
+        open_page(client1)
+        open_page(client2)
+
+        # Only the bears served by the given app are drained
+        client1.portal.call(partial(drain_all, timeout=1, backoff=0, app=server1))
+        assert app1.draining
+        assert not app2.draining
+        assert client1.get("/").status_code == 503
+        assert client2.get("/").status_code == 200
+
+        resume_all(app=server1)
+        assert client1.get("/").status_code == 200
+
+
+def test_threaded_print():
+    threads = {}
+
+    class Shown:
+        def __hrepr__(self, H, hrepr):
+            threads["repr"] = threading.get_ident()
+            return H.div("shown")
+
+    def work():
+        threads["work"] = threading.get_ident()
+        app.page.print(Shown())
+
+    @bear(threaded=True)
+    async def app(page):
+        threads["loop"] = threading.get_ident()
+        app.page = page
+        page.print(H.button(onclick=work))
+        await page.wait()
+
+    with TestClient(app) as client:
+        route = open_page(client)
+        with client.websocket_connect(f"{route}/socket") as ws:
+            start(ws)
+            button = commands(ws, lambda cmd: cmd.get("seq") == 1)[-1]
+            [method] = re.findall(r"\$\$BEAR\.func\((\d+)", button["content"])
+            ws.send_json({"type": "method", "reqid": 1, "method": int(method), "args": []})
+            received = commands(ws, lambda cmd: "shown" in cmd.get("content", ""))
+            assert received[-1]["content"] == "<div>shown</div>"
+
+    # The callback ran in a thread, but the element was represented in the loop
+    assert threads["work"] != threads["loop"]
+    assert threads["repr"] == threads["loop"]
+
+
+def test_call_method_timing(caplog):
+    app = LoneBear(None, threaded=True, max_threaded_calls=1)
+
+    async def slow_async():
+        await asyncio.sleep(0.1)
+
+    def quick():
+        time.sleep(0.03)
+
+    async def calls():
+        await app.call_method(slow_async, [])
+        # The second call waits for the first, which is not counted against it
+        await asyncio.gather(app.call_method(quick, []), app.call_method(quick, []))
+
+    with gifnoc.overlay({"starbear": {"executors": {"slow_call": 0.05}}}):
+        with caplog.at_level(logging.WARNING, logger="starbear"):
+            asyncio.run(calls())
+    assert [rec.getMessage().split(" (")[0] for rec in caplog.records] == [
+        "Slow call to test_call_method_timing.<locals>.slow_async"
+    ]
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+
+import pytest
+
+from starbear.core.executors import (
+    run_in_process,
+    run_threaded,
+    shutdown_pools,
+    stream_from_process,
+    threaded,
+    timed_call,
+    wants_thread,
+)
+
+
+def test_wants_thread():
+    def plain():
+        pass
+
+    @threaded
+    def on():
+        pass
+
+    @threaded(False)
+    def off():
+        pass
+
+    async def coro():
+        pass
+
+    assert not wants_thread(plain)
+    assert wants_thread(plain, default=True)
+    assert wants_thread(on)
+    assert not wants_thread(off, default=True)
+    assert not wants_thread(threaded(coro))
+
+
+async def _limited():
+    running = peak = 0
+    lock = threading.Lock()
+
+    def work(x):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.02)
+        with lock:
+            running -= 1
+        return (x, threading.get_ident())
+
+    limiter = asyncio.Semaphore(2)
+    results = await asyncio.gather(*[run_threaded(work, i, limiter=limiter) for i in range(6)])
+    return results, peak
+
+
+def test_run_threaded_limit():
+    results, peak = asyncio.run(_limited())
+    assert [x for x, _ in results] == list(range(6))
+    assert threading.get_ident() not in {ident for _, ident in results}
+    assert peak == 2
+
+
+def test_timed_call(caplog):
+    def slow():
+        pass
+
+    with caplog.at_level(logging.WARNING, logger="starbear"):
+        with timed_call(slow):
+            time.sleep(0.6)
+        with timed_call(slow):
+            pass
+    assert len(caplog.records) == 1
+    assert "slow" in caplog.records[0].getMessage()
+
+
+async def _processes():
+    jobs = set()
+    assert await run_in_process(pow, 2, 10, jobs=jobs) == 1024
+    assert [x async for x in stream_from_process(range, 3, jobs=jobs)] == [0, 1, 2]
+    with pytest.raises(ZeroDivisionError):
+        await run_in_process(divmod, 1, 0)
+    return jobs
+
+
+def test_process_jobs():
+    assert len(asyncio.run(_processes())) == 0
+
+
+async def _streams(n):
+    async def consume():
+        return [x async for x in stream_from_process(range, 3)]
+
+    return await asyncio.gather(*[consume() for _ in range(n)])
+
+
+def test_streams_beyond_pool_size():
+    # More streams than processes: the extra ones wait for their turn
+    n = (os.cpu_count() or 1) + 2
+    assert asyncio.run(_streams(n)) == [[0, 1, 2]] * n
+
+
+async def _pow(x, y):
+    return await run_in_process(pow, x, y)
+
+
+def test_shutdown_pools():
+    assert asyncio.run(_pow(2, 3)) == 8
+    shutdown_pools()
+    # The pools come back when needed
+    assert asyncio.run(_pow(2, 4)) == 16
+    shutdown_pools()
@@ -0,0 +1,80 @@
+from starbear.core.history import History
+
+
+def put(selector, method, content="x"):
+    return {"command": "put", "selector": selector, "method": method, "content": content}
+
+
+def test_history_compacts_inner_html():
+    h = History()
+    h.append(put("body", "beforeend"), 10)
+    for i in range(100):
+        h.append([put("#counter", "innerHTML", str(i))], 10)
+    assert list(h) == [put("body", "beforeend"), [put("#counter", "innerHTML", "99")]]
+    assert h.stats()["compacted"] == 99
+    assert h.nbytes == 20
+
+
+def test_history_compacts_subtree():
+    h = History()
+    h.append(put("#a", "beforeend"), 1)
+    h.append(put("#a .b", "innerHTML"), 1)
+    h.append(put("#a", "beforebegin"), 1)
+    h.append(put("#a", "outerHTML"), 1)
+    assert list(h) == [put("#a", "beforebegin"), put("#a", "outerHTML")]
+
+
+def test_history_keeps_mixed_entries():
+    h = History()
+    resource = {"command": "resource", "content": "<link>"}
+    h.append([resource, put("#a", "beforeend")], 1)
+    h.append(put("#a", "innerHTML"), 1)
+    assert len(h) == 2
+
+
+def test_history_keeps_siblings_and_lists():
+    h = History()
+    h.append(put("#a ~ .b", "innerHTML"), 1)
+    h.append(put("#a + .b", "innerHTML"), 1)
+    h.append(put("#a .b, #c", "innerHTML"), 1)
+    h.append(put("#a.b", "innerHTML"), 1)
+    h.append(put("#ab .c", "innerHTML"), 1)
+    h.append(put("#a > .b", "innerHTML"), 1)
+    h.append(put("#a>.c", "innerHTML"), 1)
+    h.append(put("#a", "innerHTML"), 1)
+    assert [entry["selector"] for entry in h] == [
+        "#a ~ .b",
+        "#a + .b",
+        "#a .b, #c",
+        "#a.b",
+        "#ab .c",
+        "#a",
+    ]
+
+
+def test_history_keeps_evals():
+    h = History()
+    h.append([put("#a .b", "innerHTML"), {"command": "eval", "code": "f()"}], 1)
+    h.append(put("#a", "innerHTML"), 1)
+    assert len(h) == 2
+
+
+def test_history_caps():
+    h = History(max_entries=3, max_bytes=25)
+    for i in range(5):
+        h.append(put("body", "beforeend", str(i)), 10)
+    assert [entry["content"] for entry in h] == ["3", "4"]
+    assert h.stats()["truncated"] == 3
+
+
+def test_history_dump_load():
+    h = History()
+    h.append(put("body", "beforeend"), 10)
+    h.append(put("#a", "innerHTML"), 5)
+    entries = h.dump()
+    assert len(h) == 0 and h.nbytes == 0
+    h.load(entries)
+    assert list(h) == [put("body", "beforeend"), put("#a", "innerHTML")]
+    assert h.nbytes == 15
+    h.append(put("#a", "innerHTML"), 5)
+    assert len(h) == 2 and h.nbytes == 15
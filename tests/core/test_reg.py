@@ -0,0 +1,177 @@
+import asyncio
+import gc
+
+import pytest
+
+from starbear.core.reg import (
+    FileRegistry,
+    FutureRegistry,
+    ObjectRegistry,
+    QueueRegistry,
+    StrongRegistry,
+    StrongRotatingRegistry,
+    WeakRegistry,
+    file_hash,
+)
+from starbear.core.utils import Queue
+
+
+class Thing:
+    def method(self):
+        return 1
+
+
+def test_weak_registry_collects():
+    reg = WeakRegistry()
+    thing = Thing()
+    tid = reg.register(thing)
+    mid = reg.register(thing.method)
+    assert reg.resolve(mid)() == 1
+    assert len(reg) == 2
+    del thing
+    gc.collect()
+    assert len(reg) == 0
+    assert tid not in reg.map
+
+
+def test_weak_registry_reused_id():
+    reg = WeakRegistry()
+    a, b = Thing(), Thing()
+    reg.register(a, id=1)
+    reg.register(b, id=1)
+    del a
+    gc.collect()
+    assert reg.resolve(1) is b
+
+
+def test_object_registry_len():
+    reg = ObjectRegistry(strongrefs=10)
+    thing = Thing()
+    reg.register(thing)
+    reg.register(1234)
+    assert len(reg) == 2
+    del thing
+    gc.collect()
+    assert len(reg) == 1
+
+
+def test_weak_registry_dedup():
+    reg = WeakRegistry()
+    thing = Thing()
+    assert reg.register(thing) == reg.register(thing)
+    assert reg.register(thing.method) == reg.register(thing.method)
+    assert len(reg) == 2
+    other = Thing()
+    assert reg.register(other.method) != reg.register(thing.method)
+
+
+def test_strong_registries_dedup():
+    for reg in [StrongRegistry(), StrongRotatingRegistry(keep=2, rotate=False)]:
+        thing = Thing()
+        ids = {reg.register(thing.method) for _ in range(10)}
+        assert len(ids) == 1
+        assert len(reg) == 1
+
+
+def test_rotating_registry_refreshes():
+    reg = StrongRotatingRegistry(keep=2, rotate=True)
+    a, b, c = Thing(), Thing(), Thing()
+    aid = reg.register(a)
+    reg.register(b)
+    assert reg.register(a) == aid
+    reg.register(c)
+    assert reg.resolve(aid) is a
+    assert len(reg) == 2
+
+
+async def _futures():
+    reg = FutureRegistry(timeout=0.01)
+    resolved, expired, cancelled = (asyncio.Future() for _ in range(3))
+    fid = reg.register(resolved)
+    reg.register(expired)
+    reg.register(cancelled, timeout=10)
+    assert len(reg) == 3
+    reg.resolve(fid, 1)
+    cancelled.cancel()
+    with pytest.raises(TimeoutError):
+        await expired
+    await asyncio.sleep(0)
+    assert await resolved == 1
+    assert len(reg) == 0
+
+    pending = asyncio.Future()
+    reg.register(pending, timeout=10)
+    reg.reject_all("closed")
+    with pytest.raises(Exception, match="closed"):
+        await pending
+    assert len(reg) == 0
+
+
+def test_future_registry():
+    asyncio.run(_futures())
+
+
+async def _queue_policies():
+    reg = QueueRegistry()
+    results = {}
+    for overflow in ["drop_oldest", "drop_newest", "latest"]:
+        q = Queue(2, overflow=overflow)
+        dropped = await reg.put_many(reg.register(q), [1, 2, 3, 4])
+        results[overflow] = (dropped, [q.get_nowait() for _ in range(q.qsize())])
+    assert results == {
+        "drop_oldest": (2, [3, 4]),
+        "drop_newest": (2, [1, 2]),
+        "latest": (3, [4]),
+    }
+
+    q = Queue(1)
+    qid = reg.register(q)
+    task = asyncio.create_task(reg.put_many(qid, [1, 2]))
+    await asyncio.sleep(0)
+    assert not task.done()
+    assert q.get_nowait() == 1
+    assert await task == 0
+    assert q.get_nowait() == 2
+
+
+def test_queue_overflow():
+    asyncio.run(_queue_policies())
+    with pytest.raises(ValueError):
+        Queue(overflow="explode")
+
+
+def test_file_registry(tmp_path):
+    (tmp_path / "starbear-anchor").touch()
+    (tmp_path / "sub").mkdir()
+    reg = FileRegistry()
+    url = reg.register(tmp_path / "sub" / "a.css")
+    base, _, rest = url.partition("/")
+    assert rest == "sub/a.css"
+    assert reg.register(tmp_path / "b.js") == f"{base}/b.js"
+    assert reg.get_file_from_url(url) == str(tmp_path / "sub" / "a.css")
+    assert reg.get_file_from_url(f"{base}/../etc/passwd") is None
+    assert reg.get_file_from_url("nope/a.css") is None
+
+
+def test_file_registry_escape(tmp_path):
+    root = tmp_path / "root"
+    root.mkdir()
+    (root / "starbear-anchor").touch()
+    (tmp_path / "secret").write_text("!")
+    (root / "link").symlink_to(tmp_path / "secret")
+    reg = FileRegistry()
+    base, _, _ = reg.register(root / "a.css").partition("/")
+    assert reg.get_file_from_url(f"{base}//etc/passwd") is None
+    assert reg.get_file_from_url(f"{base}/sub/../../secret") is None
+    # Symbolic links under the anchor are served like the files register() gives URLs for
+    assert reg.register(root / "link") == f"{base}/link"
+    assert reg.get_file_from_url(f"{base}/link") == str(root / "link")
+
+
+def test_file_registry_hash(tmp_path):
+    (tmp_path / "a.js").write_text("one")
+    reg = FileRegistry(hash_files=True)
+    url1 = reg.register(tmp_path / "a.js")
+    assert url1.endswith(f"a.js?v={file_hash(tmp_path / 'a.js')}")
+    (tmp_path / "a.js").write_text("two!")
+    assert reg.register(tmp_path / "a.js") != url1
@@ -0,0 +1,112 @@
+import asyncio
+import io
+
+import pytest
+from starlette.requests import Request
+
+from starbear.core.responses import (
+    FileRangeResponse,
+    RangeNotSatisfiable,
+    large_transfer_limiter,
+    parse_range,
+)
+from starbear.core.utils import VirtualFile
+
+
+def request(**headers):
+    return Request(
+        {
+            "type": "http",
+            "headers": [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()],
+        }
+    )
+
+
+def test_parse_range():
+    assert parse_range(request(), 100) is None
+    assert parse_range(request(range="bytes=10-19"), 100) == (10, 20)
+    assert parse_range(request(range="bytes=90-"), 100) == (90, 100)
+    assert parse_range(request(range="bytes=-5"), 100) == (95, 100)
+    assert parse_range(request(range="bytes=0-1,5-6"), 100) is None
+    assert parse_range(request(range="bytes=20-10"), 100) is None
+    assert parse_range(request(range="bytes=0-1", if_range='"old"'), 100, etag='"new"') is None
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(request(range="bytes=100-"), 100)
+
+
+async def join(chunks):
+    return b"".join([chunk async for chunk in chunks])
+
+
+async def collect(vf, *args):
+    return await join(vf.chunks(*args))
+
+
+def test_virtual_file_contents():
+    data = bytes(range(256)) * 1000
+    for content in [data, memoryview(data), io.BytesIO(data)]:
+        vf = VirtualFile(content, name="data.bin")
+        assert vf.type == "application/octet-stream"
+        assert asyncio.run(vf.size()) == len(data)
+        assert asyncio.run(collect(vf, 1000, 2000)) == data[1000:2000]
+        assert asyncio.run(collect(vf)) == data
+        assert vf.digest is not None
+
+
+def test_virtual_file_stream():
+    async def rows():
+        yield "a\n"
+        yield b"b\n"
+
+    vf = VirtualFile(rows(), name="rows.csv")
+    assert vf.name.endswith("/rows.csv")
+    assert not vf.replayable
+    chunks = vf.chunks()
+    # Claimed before anything is read
+    assert vf.consumed
+    with pytest.raises(Exception, match="already consumed"):
+        vf.chunks()
+    assert asyncio.run(join(chunks)) == b"a\nb\n"
+
+
+def test_virtual_file_name():
+    assert VirtualFile("hello", name="x.txt").name == "5d41402abc4b2a76b9719d911017c592/x.txt"
+
+
+async def send_file(response, extensions=None):
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    await response({"type": "http", "method": "GET", "extensions": extensions or {}}, None, send)
+    return messages
+
+
+def test_file_range_response(tmp_path):
+    data = bytes(range(256)) * 10_000
+    (tmp_path / "data.bin").write_bytes(data)
+    response = FileRangeResponse(tmp_path / "data.bin", size=len(data), range=(100, 2_000_000))
+    response.chunk_size = 1 << 20
+    start, *bodies = asyncio.run(send_file(response))
+    assert start["status"] == 206
+    assert (b"content-range", b"bytes 100-1999999/2560000") in start["headers"]
+    assert len(bodies) == 2
+    assert b"".join(b["body"] for b in bodies) == data[100:2_000_000]
+    assert not bodies[-1]["more_body"]
+
+    response = FileRangeResponse(tmp_path / "data.bin", size=len(data))
+    _, zerocopy = asyncio.run(send_file(response, {"http.response.zerocopysend": {}}))
+    assert zerocopy["type"] == "http.response.zerocopysend"
+    assert (zerocopy["offset"], zerocopy["count"]) == (0, len(data))
+
+
+async def _limiters():
+    return large_transfer_limiter(), large_transfer_limiter()
+
+
+def test_large_transfer_limiter_per_loop():
+    a1, a2 = asyncio.run(_limiters())
+    b1, _ = asyncio.run(_limiters())
+    assert a1 is a2
+    assert a1 is not b1
@@ -0,0 +1,16 @@
+from starbear.core.spill import SpillStore
+
+
+def test_spill_store(tmp_path):
+    store = SpillStore(tmp_path)
+    store.put("a", {"history": [[{"command": "put"}, 10]]})
+    store.put("b", [1, 2, 3])
+    assert len(store) == 2
+    assert store.nbytes > 0
+    assert store.take("a") == {"history": [[{"command": "put"}, 10]]}
+    assert store.take("a") is None
+    store.discard("b")
+    assert len(store) == 0
+    assert store.nbytes == 0
+    store.close()
+    assert list(tmp_path.iterdir()) == []
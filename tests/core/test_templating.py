@@ -1,6 +1,9 @@
+from pathlib import Path
+
 from hrepr import H, Tag
 
-from starbear import template
+from starbear import Template, template
+from starbear.core.templating import TemplateCache, _compile
 
 
 def test_template_int():
@@ -14,3 +17,50 @@ def test_template_tag():
     tpl = "<div>{{x}}</div>"
     result = template(tpl, x=H.b("hello"))
     assert str(result) == "<div><b>hello</b></div>"
+
+
+def test_template_compiled_matches_interpreted():
+    tpl = '<div class="{{cls}} x"><p>static <b>text</b></p>{{x}}<span>{{y}}</span></div>'
+    values = {"cls": "c", "x": H.i("hello"), "y": 3}
+    compiled = Template(tpl)(**values)
+    interpreted = Template(tpl, compiled=False)(**values)
+    assert str(compiled) == str(interpreted)
+    assert compiled.name == "div"
+
+
+def test_template_tag_not_serialized():
+    def f():
+        pass
+
+    tpl = H.div(H.button(onclick=f), H.img(src=Path("x.png")), H.raw("<i>x</i>"))
+    assert Template(tpl).plan is None
+    # Only the page's representer can serialize these attributes
+    button, img, _ = _compile(tpl)({}).children
+    assert button.attributes["onclick"] is f
+    assert img.attributes["src"] == Path("x.png")
+
+
+def test_template_static():
+    tpl = Template("<div><b>hello</b></div>")
+    assert tpl() is tpl()
+    assert str(tpl()) == "<div><b>hello</b></div>"
+
+
+def test_template_cache_lru():
+    cache = TemplateCache(maxsize=2)
+    a = cache.get("<div>a</div>")
+    cache.get("<div>b</div>")
+    assert cache.get("<div>a</div>") is a
+    cache.get("<div>c</div>")
+    assert "<div>b</div>" not in cache.entries
+    assert cache.stats() == {"size": 2, "maxsize": 2, "hits": 1, "misses": 3, "evictions": 1}
+
+
+def test_template_cache_mtime(tmp_path):
+    pth = tmp_path / "tpl.html"
+    pth.write_text("<div>{{x}}</div>")
+    cache = TemplateCache()
+    assert str(cache.get(pth)(x=1)) == "<div>1</div>"
+    assert cache.get(pth) is cache.get(pth)
+    pth.write_text("<span>{{x}}!</span>")
+    assert str(cache.get(pth)(x=1)) == "<span>1!</span>"
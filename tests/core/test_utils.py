@@ -0,0 +1,21 @@
+import asyncio
+
+from starbear.core.utils import CancelScope
+
+
+async def _scope():
+    scope = CancelScope()
+    tasks = scope.group("tasks")
+    done = scope.track("tasks", asyncio.ensure_future(asyncio.sleep(0)))
+    pending = [scope.track("tasks", asyncio.ensure_future(asyncio.sleep(10))) for _ in range(2)]
+    job = scope.track("jobs", asyncio.Future())
+    await done
+    assert len(tasks) == 2 and len(scope) == 3
+    assert scope.cancel() == {"tasks": 2, "jobs": 1}
+    await asyncio.wait(pending)
+    assert all(t.cancelled() for t in [*pending, job])
+    assert len(scope) == 0
+
+
+def test_cancel_scope():
+    asyncio.run(_scope())
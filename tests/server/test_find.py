@@ -2,11 +2,13 @@ from pathlib import Path
 
 import pytest
 
+from starbear import bear, simplebear
 from starbear.server.find import (
     collect_locations,
     collect_routes,
     collect_routes_from_module,
     compile_routes,
+    lonebear_prefixes,
 )
 
 
@@ -25,3 +27,16 @@ def test_collect_locations():
 
     locs = collect_locations(collect_routes_from_module(app_hello))
     assert all(x.is_relative_to(Path(app_hello.__file__).parent) for x in locs)
+
+
+def test_lonebear_prefixes():
+    @simplebear
+    async def lone(request):
+        return "lone"
+
+    @bear
+    async def mother(page):
+        pass
+
+    routes = {"/": {"/a/": lone, "/b": {"/c": lone, "/d": mother}}, "/index/": lone}
+    assert sorted(lonebear_prefixes("/", routes)) == ["/", "/a", "/b/c", "/index"]
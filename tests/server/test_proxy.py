@@ -0,0 +1,132 @@
+import re
+
+import pytest
+import uvicorn
+from starlette.applications import Starlette
+from starlette.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from starbear import H, UsageError, bear, simplebear
+from starbear.__main__ import _isolate_entry
+from starbear.server.proxy import WorkerPool, WorkerProxy
+from starbear.server.serve import ThreadableServer
+
+
+def test_worker_pool_round_robin():
+    pool = WorkerPool(["a", "b", "c"])
+    assert [pool.choose("/") for _ in range(4)] == [0, 1, 2, 0]
+
+
+def test_worker_pool_sticky_process():
+    pool = WorkerPool(["a", "b", "c"])
+    assert pool.choose("/!2.abcd/socket") == 2
+    assert pool.choose("/app/!1.abcd/method/3") == 1
+
+
+def test_worker_pool_groups():
+    pool = WorkerPool(
+        ["a", "b", "c", "d"],
+        groups={"/": range(2), "/heavy/": range(2, 4), "/heavy/one": [3]},
+    )
+    assert [pool.choose("/heavy") for _ in range(3)] == [2, 3, 2]
+    assert [pool.choose("/heavy/one/x") for _ in range(2)] == [3, 3]
+    assert [pool.choose("/heavyweight") for _ in range(2)] == [0, 1]
+    assert pool.choose("/heavy/!0.abcd/socket") == 0
+
+
+def test_worker_pool_pin():
+    pool = WorkerPool(["a", "b", "c"], groups={"/": range(2), "/heavy": [2]})
+    assert pool.pin("/app/") == 0
+    assert pool.pin("/heavy/lone") == 2
+    assert [pool.choose("/app") for _ in range(2)] == [0, 0]
+    assert pool.choose("/app/!/method/3") == 0
+    assert pool.choose("/heavy/lone/!/file/abcd/x.png") == 2
+    # Only the LoneBear's own routes are pinned
+    assert [pool.choose("/app/other") for _ in range(2)] == [1, 0]
+    assert pool.choose("/app/!1.abcd/socket") == 1
+
+
+def test_isolate_entry():
+    assert _isolate_entry("/heavy") == ("/heavy", 1)
+    assert _isolate_entry("/heavy=3") == ("/heavy", 3)
+    for spec in ["/heavy=x", "/heavy=0", "=2"]:
+        with pytest.raises(UsageError):
+            _isolate_entry(spec)
+
+
+@bear
+async def hello(page):
+    page.print(H.div("hello"))
+    await page.wait()
+
+
+@pytest.fixture
+def worker(tmp_path):
+    path = str(tmp_path / "worker.sock")
+    config = uvicorn.Config(app=Starlette(routes=hello.routes()), uds=path, log_level="warning")
+    with ThreadableServer(config=config).run_in_thread():
+        yield path
+
+
+def test_worker_proxy(worker):
+    with TestClient(WorkerProxy(WorkerPool([worker]))) as client:
+        response = client.get("/")
+        assert response.status_code == 200
+        route = re.search(r'new Constructor\("([^"]+)"\)', response.text).group(1)
+
+        with client.websocket_connect(f"{route}/socket") as ws:
+            ws.send_json({"type": "start", "number": 1, "seq": 0})
+            assert ws.receive_json() == [{"command": "sync", "seq": 0}]
+            frame = ws.receive_json()
+            assert frame[-1]["content"] == "<div>hello</div>"
+
+        # Close codes from the worker are passed on to the page
+        with client.websocket_connect("/!nope/socket") as ws:
+            with pytest.raises(WebSocketDisconnect) as exc:
+                ws.receive_json()
+            assert exc.value.code == 3002
+
+
+def test_worker_proxy_unreachable(tmp_path):
+    with TestClient(WorkerProxy(WorkerPool([tmp_path / "missing.sock"]))) as client:
+        assert client.get("/").status_code == 502
+
+
+def make_lonebear():
+    def ping():
+        return "pong"
+
+    @simplebear
+    async def lone(request):
+        return H.button("ping", onclick=ping)
+
+    return lone
+
+
+@pytest.fixture
+def lone_workers(tmp_path):
+    # Separate instances stand in for the copies that live in each worker process
+    paths = [str(tmp_path / f"worker{i}.sock") for i in range(2)]
+    servers = [
+        ThreadableServer(
+            config=uvicorn.Config(
+                app=Starlette(routes=make_lonebear().routes()), uds=path, log_level="warning"
+            )
+        )
+        for path in paths
+    ]
+    with servers[0].run_in_thread(), servers[1].run_in_thread():
+        yield paths
+
+
+def test_worker_proxy_lonebear(lone_workers):
+    pool = WorkerPool(lone_workers)
+    pool.pin("/")
+    with TestClient(WorkerProxy(pool)) as client:
+        for _ in range(2):
+            response = client.get("/")
+            assert response.status_code == 200
+            [method] = re.findall(r"\$\$BEAR\.func\((\d+)", response.text)
+            # Without the pin, every other call would reach a worker that does not know the method
+            for _ in range(3):
+                assert client.post(f"/!/method/{method}", json=[]).json() == "pong"